@@ -1,5 +1,7 @@
 
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -13,9 +15,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-t@prdd1bj0zneldnzx44i34mohygt%&h&y7!lo04=orh8^*rra'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = list(filter(None, os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')))
 
 
 # Application definition
@@ -36,6 +38,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'expenses_app.metrics.MetricsMiddleware',
+    # Compresses responses for clients that send `Accept-Encoding: gzip`.
+    'django.middleware.gzip.GZipMiddleware',
+    'expenses_app.db_routers.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,13 +73,124 @@ WSGI_APPLICATION = 'expenses.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+#
+# Configured from the environment:
+#   DB_ENGINE         sqlite (default) or postgresql
+#   DB_NAME           database name, or the file path for SQLite
+#   DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   DB_CONN_MAX_AGE   seconds to keep a connection open between requests (default 60)
+#   DB_POOL           "1" to use psycopg's connection pool instead (PostgreSQL only)
+#   DB_REPLICAS       comma-separated replica hosts (PostgreSQL) or files (SQLite),
+#                     exposed as the aliases replica_1, replica_2, ...
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    _primary = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'expenses'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # Pooled connections are returned to the pool, not kept per thread.
+        _primary['CONN_MAX_AGE'] = 0
+        _primary['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        }
+    _replica_setting = 'HOST'
+else:
+    _primary = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers run alongside the single writer; IMMEDIATE takes
+            # the write lock at BEGIN so concurrent writers wait on busy_timeout
+            # instead of failing with "database is locked" mid-transaction.
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA busy_timeout=5000;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA mmap_size=134217728;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+    _replica_setting = 'NAME'
+
+DATABASES = {'default': _primary}
+for _number, _value in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{_number}'] = {
+        **_primary,
+        _replica_setting: _value.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+
+# Aliases that ExpenseIncomeViewSet's read-only actions may be served from.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['expenses_app.db_routers.PrimaryReplicaRouter']
+
+
+# Caches
+# `versions` holds the per-user data versions of the response cache
+# (expenses_app.caching). Every process must see the same versions, or one
+# keeps serving entries another has invalidated: with REDIS_URL set
+# (pip install redis) they live in Redis, otherwise in files under
+# SHARED_CACHE_DIR, which every process on this host shares. `auth` holds
+# users resolved from JWTs (expenses_app.authentication) and is shared the
+# same way, so saving or deleting a user drops the entry for every process.
+# Deployments across several hosts need REDIS_URL. `default` holds the
+# throttle counters, which are per process without REDIS_URL.
+
+REDIS_URL = os.environ.get('REDIS_URL', '')
+SHARED_CACHE_DIR = Path(os.environ.get('SHARED_CACHE_DIR', Path(tempfile.gettempdir()) / 'expenses-cache'))
+
+if REDIS_URL:
+    _shared_cache = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}
+    _default_cache = {**_shared_cache, 'KEY_PREFIX': 'default'}
+    _versions_cache = {**_shared_cache, 'KEY_PREFIX': 'versions', 'TIMEOUT': None}
+    _auth_cache = {**_shared_cache, 'KEY_PREFIX': 'auth', 'TIMEOUT': 300}
+else:
+    _default_cache = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    _versions_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_DIR / 'versions',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+    _auth_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': SHARED_CACHE_DIR / 'auth',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+CACHES = {
+    'default': _default_cache,
+    'versions': _versions_cache,
+    'auth': _auth_cache,
+    # Cached list/retrieve payloads. Entries are keyed by data version, so
+    # this one may stay per process.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
 }
 
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE', '1') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -106,11 +223,27 @@ USE_I18N = True
 USE_TZ = True
 
 
+# Request metrics (see expenses_app.metrics). Requests slower than the budget
+# are logged with their SQL; /metrics requires METRICS_TOKEN outside DEBUG.
+
+SLOW_REQUEST_BUDGET_MS = int(os.environ.get('SLOW_REQUEST_BUDGET_MS', 1000))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Records older than this many days may be moved to the archive table by
+# `manage.py archive_expenses`; lists and exports read it for date filters
+# that reach back past it (see expenses_app.archive).
+
+EXPENSE_ARCHIVE_AFTER_DAYS = int(os.environ.get('EXPENSE_ARCHIVE_AFTER_DAYS', 365))
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
 
+# Uploaded files (CSV imports waiting for `manage.py process_imports`)
+
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -118,16 +251,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'expenses_app.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     
-    # Renderers - Define how responses are rendered
+    # Renderers - Define how responses are rendered. The HTML renderers are
+    # for browsing the API while developing, so production serves JSON only.
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-        'rest_framework.renderers.AdminRenderer',
+        'expenses_app.renderers.FastJSONRenderer',
+        *([
+            'rest_framework.renderers.BrowsableAPIRenderer',
+            'rest_framework.renderers.AdminRenderer',
+        ] if DEBUG else []),
     ],
     
     # Parsers - Define how requests are parsed
@@ -139,8 +275,8 @@ REST_FRAMEWORK = {
     
     # Throttling - Rate limiting
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'expenses_app.throttling.AnonCounterRateThrottle',
+        'expenses_app.throttling.UserCounterRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -1,6 +1,68 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import ExpenseIncome, UserPurge
+from .search import WORD_RE, get_search_backend
+
+
+def estimated_row_count(model, using):
+    """
+    The planner's idea of how many rows `model`'s table has, without reading
+    it: pg_class.reltuples on PostgreSQL, sqlite_stat1 on SQLite. None when
+    the table hasn't been analyzed or the database has no statistics.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of each row is the table's row count.
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    count = int(str(row[0]).split()[0])
+    # PostgreSQL reports -1 for tables never analyzed.
+    return count if count >= 0 else None
+
+
+class CappedCount(int):
+    """A count that stopped at its limit, shown as "10000+" by the changelist."""
+
+    def __str__(self):
+        return f'{int(self)}+'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Pages the changelist without a COUNT(*) over the whole table. Unfiltered,
+    the count is the table statistics' estimate once that is past
+    `count_limit`; filtered, counting stops at `count_limit` rows, so pages
+    past it aren't linked and the filter needs narrowing instead.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.has_filters():
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        # One row past the limit tells a capped count from an exact one.
+        count = queryset.order_by()[:self.count_limit + 1].count()
+        return CappedCount(self.count_limit) if count > self.count_limit else count
 
-from .models import ExpenseIncome
 
 @admin.register(ExpenseIncome)
 class ExpenseIncomeAdmin(admin.ModelAdmin):
@@ -16,6 +78,95 @@ class ExpenseIncomeAdmin(admin.ModelAdmin):
         'created_at',
         'updated_at'
     )
-    # list_filter = ('transaction_type', 'tax_type', 'created_at','updated_at')
-    # search_fields = ('title', 'description', 'user__username')
+    # The user is joined into the page query rather than fetched per row.
+    list_select_related = ('user',)
+    list_filter = ('transaction_type', 'tax_type', 'created_at')
+    search_fields = ('title', 'description', 'user__username')
     # readonly_fields = ('total', 'created_at', 'updated_at')
+    paginator = EstimatedCountPaginator
+    # Filtered pages would otherwise also count the whole table for "N total".
+    show_full_result_count = False
+    # A page of ids is enough to pick a user; a <select> would load every user.
+    raw_id_fields = ('user',)
+    actions = ['mark_credit', 'mark_debit', 'set_flat_tax', 'set_percentage_tax']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total()
+
+    @admin.display(ordering='total')
+    def total(self, obj):
+        return obj.total
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches go to the full-text index rather than LIKE over every row.
+        A search that is exactly a username also lists that user's records.
+        """
+        words = WORD_RE.findall(search_term)
+        backend = get_search_backend(queryset.db) if words else None
+        if backend is None:
+            return super().get_search_results(request, queryset, search_term)
+        matches = backend.search(queryset, words)
+        user_id = User.objects.filter(username=search_term.strip()).values_list('pk', flat=True).first()
+        if user_id is not None:
+            matches |= queryset.filter(user_id=user_id)
+        return matches, False
+
+    def edit_selected(self, request, queryset, **values):
+        # One UPDATE per batch of rows, rather than a save() per object.
+        edited = queryset.edit(**values)
+        self.message_user(request, f'Updated {edited} record(s).', messages.SUCCESS)
+
+    @admin.action(description='Mark selected records as credit', permissions=['change'])
+    def mark_credit(self, request, queryset):
+        self.edit_selected(request, queryset, transaction_type='credit')
+
+    @admin.action(description='Mark selected records as debit', permissions=['change'])
+    def mark_debit(self, request, queryset):
+        self.edit_selected(request, queryset, transaction_type='debit')
+
+    @admin.action(description='Set tax type to flat', permissions=['change'])
+    def set_flat_tax(self, request, queryset):
+        self.edit_selected(request, queryset, tax_type='flat')
+
+    @admin.action(description='Set tax type to percentage', permissions=['change'])
+    def set_percentage_tax(self, request, queryset):
+        self.edit_selected(request, queryset, tax_type='percentage')
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class PurgingUserAdmin(UserAdmin):
+    """
+    Deleting users queues a UserPurge instead of cascading in the request;
+    see expenses_app.purges.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        # The default lists every related row, loading them all to do it.
+        objs = list(objs)
+        return [str(obj) for obj in objs], {User._meta.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, [obj])
+
+    def delete_queryset(self, request, queryset):
+        users = list(queryset)
+        for user in users:
+            UserPurge.objects.request(user)
+        self.message_user(
+            request, f'Deactivated {len(users)} user(s); their records are deleted in the background.',
+            messages.INFO,
+        )
+
+
+@admin.register(UserPurge)
+class UserPurgeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user_id', 'username', 'status', 'rows_deleted', 'requested_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = [field.name for field in UserPurge._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
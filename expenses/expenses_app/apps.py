@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ExpensesAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expenses_app'
+
+    def ready(self):
+        from . import authentication, caching, metrics, search  # noqa: F401  (connect the signal receivers)
@@ -0,0 +1,80 @@
+"""
+Reading archived records back into lists and exports.
+
+`manage.py archive_expenses` moves ExpenseIncome rows older than
+settings.EXPENSE_ARCHIVE_AFTER_DAYS to ArchivedExpense, so the hot table and
+its indexes hold recent months only and list latency doesn't grow with
+account age. Balances, rollups and the change feed still count archived rows.
+
+Lists and exports include them when a `created_at` filter reaches past the
+horizon: an upper bound on its own, or a lower bound older than the horizon.
+The matching rows of both tables are then read as one UNION ALL, ordered by
+`?ordering=` or the view's default. Archived rows aren't in the full-text
+index, so searches match them with SearchFilter's LIKE, and results aren't
+ranked by relevance. Without such a filter only the hot table is read.
+
+Analytics always count archived rows, like the rollups they are read from;
+when a filter sends them to the ledger instead, both tables are grouped and
+the buckets added up.
+"""
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+from .models import ArchivedExpense, total_expression
+
+DATE_FILTERS = ('created_at', 'created_at__gte', 'created_at__lte')
+
+
+def archived_queryset(view, whole_history=False):
+    """
+    The archived records matching the view's request, or None when its
+    filters don't reach back to the archive. With `whole_history` the date
+    filters only narrow the rows, as they do for the hot table.
+    """
+    request = view.request
+    queryset = ArchivedExpense.objects.with_total()
+    if not request.user.is_superuser:
+        queryset = queryset.filter(user=request.user)
+    filterset = view.filterset_class(request.query_params, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    dates = {name: filterset.form.cleaned_data.get(name) for name in DATE_FILTERS}
+    if not whole_history:
+        if not any(dates.values()):
+            return None
+        earliest = dates['created_at'] or dates['created_at__gte']
+        if earliest is not None and earliest >= ArchivedExpense.objects.horizon():
+            return None
+    return filters.SearchFilter().filter_queryset(request, filterset.qs, view)
+
+
+def with_archived(view, queryset, fields):
+    """
+    `queryset.values(*fields)`; when the request reaches the archive, those
+    rows and the matching archived ones, ordered like the view's list.
+    """
+    archived = archived_queryset(view)
+    if archived is None:
+        return queryset.values(*fields)
+    ordering = filters.OrderingFilter().get_ordering(view.request, queryset, view)
+    parts = [queryset.order_by(), archived.order_by()]
+    if any(term.lstrip('-') == 'total' for term in ordering):
+        # A UNION can only be ordered by the columns it selects.
+        parts = [part.annotate(total=total_expression()) for part in parts]
+        fields = [*fields, 'total']
+    hot, cold = (part.values(*fields) for part in parts)
+    return hot.union(cold, all=True).order_by(*ordering)
+
+
+def buckets_with_archived(querysets, period):
+    """The analytics buckets of the hot and archived querysets, added up."""
+    merged = {}
+    for queryset in querysets:
+        for bucket in queryset.buckets(period):
+            key = (bucket['period'], bucket['transaction_type'])
+            if key not in merged:
+                merged[key] = bucket
+                continue
+            for name in ('bucket_count', 'bucket_amount', 'bucket_tax', 'bucket_total'):
+                merged[key][name] += bucket[name]
+    return [merged[key] for key in sorted(merged)]
@@ -0,0 +1,132 @@
+"""
+Async versions of the ExpenseIncomeViewSet actions that carry most traffic:
+list, retrieve, create and summary, routed under api/async/expenses/.
+
+Under ASGI a sync view holds one of the thread pool's threads for its whole
+run, so the pool caps how many requests a process serves at once. These
+views run on the event loop instead. Database work goes through the async
+ORM, and the shared caches behind authentication and cached responses are
+read in a thread too, since they block on disk or Redis. Each of those
+holds a thread only for the read, not for the whole request. Responses are
+the same as ExpenseIncomeViewSet's.
+"""
+import inspect
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Sum
+from django.http import Http404
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+
+from .models import ExpenseIncome, UserBalance
+from .search import ExpenseSearchFilter, aprobe_search_backends
+from .serializers import UserBalanceSerializer
+from .views import ExpenseIncomeViewSet
+
+
+class AsyncExpenseIncomeViewSet(ExpenseIncomeViewSet):
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        # Tell Django the view returns a coroutine, so it is awaited on the
+        # event loop instead of being run in a thread.
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        """APIView.dispatch(), awaiting authentication and the handler."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aperform_authentication(self, request):
+        """
+        Request._authenticate() for the event loop: authenticators with an
+        aauthenticate() are awaited, others run in a thread. initial() then
+        finds request.user already set.
+        """
+        for authenticator in request.authenticators:
+            authenticate = getattr(authenticator, 'aauthenticate', None) or sync_to_async(authenticator.authenticate)
+            try:
+                user_auth_tuple = await authenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def aget_object(self):
+        """get_object() on the async ORM."""
+        if self.checked_object is None:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                obj = await ExpenseIncome.objects.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except ExpenseIncome.DoesNotExist:
+                raise Http404(f'No {ExpenseIncome._meta.object_name} matches the given query.')
+            except (TypeError, ValueError, ValidationError):
+                raise Http404
+            self.check_object_permissions(self.request, obj)
+            self.checked_object = obj
+        return self.checked_object
+
+    async def list(self, request, *args, **kwargs):
+        return await self.acached_response(self.alist, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        if request.query_params.get(ExpenseSearchFilter.search_param):
+            await aprobe_search_backends()
+        queryset = self.list_rows(self.filter_queryset(self.get_queryset()))
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is None:
+            serializer = self.get_serializer([row async for row in queryset], many=True)
+            return Response(serializer.data)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        return await self.acached_response(self.aretrieve, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object())
+        return Response(serializer.data)
+
+    async def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.instance = await ExpenseIncome.objects.acreate(user=request.user, **serializer.validated_data)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
+    async def summary(self, request):
+        if request.user.is_superuser:
+            totals = await UserBalance.objects.aaggregate(
+                **{name: Sum(name, default=0) for name in UserBalance.objects.delta_fields}
+            )
+            balance = UserBalance(**totals)
+        else:
+            balance = await UserBalance.objects.afor_user(request.user)
+        return Response(UserBalanceSerializer(balance).data)
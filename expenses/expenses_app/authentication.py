@@ -0,0 +1,77 @@
+"""
+JWT authentication without the per-request user query.
+
+Resolved users are kept in the `auth` cache, keyed by user id. Each entry
+remembers the token version it was loaded for (the password-hash claim when
+SIMPLE_JWT's CHECK_REVOKE_TOKEN is on), so a token issued before a password
+change never matches. Saving or deleting a user drops its entry, which
+covers deactivation and password changes. The cache is shared by every
+process (see settings), so that happens everywhere at once.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+CACHE_ALIAS = 'auth'
+
+
+def user_cache_key(user_id):
+    return f'jwt-user:{user_id}'
+
+
+def token_version(validated_token):
+    if api_settings.CHECK_REVOKE_TOKEN:
+        return validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+    return None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            self.cache_user(validated_token, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views. The auth cache is on disk or in Redis,
+        so the user is resolved in a thread, cached or not.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await sync_to_async(self.get_user)(validated_token), validated_token
+
+    def get_cached_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cached = caches[CACHE_ALIAS].get(user_cache_key(user_id))
+        if cached is None or cached[0] != token_version(validated_token):
+            return None
+        user = cached[1]
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+    def cache_user(self, validated_token, user):
+        key = user_cache_key(validated_token[api_settings.USER_ID_CLAIM])
+        caches[CACHE_ALIAS].set(key, (token_version(validated_token), user))
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    caches[CACHE_ALIAS].delete(user_cache_key(getattr(instance, api_settings.USER_ID_FIELD)))
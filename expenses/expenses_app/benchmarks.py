@@ -0,0 +1,585 @@
+"""
+Benchmark scenarios for the expenses API.
+
+Run them with `python manage.py benchmark <scenario>`. Every scenario runs
+against a throwaway test database, so `db.sqlite3` is never touched.
+"""
+import asyncio
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache, caches
+from django.utils import timezone
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+from django.urls import resolve
+from django.utils.text import compress_string
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.throttling import UserRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import ArchivedExpense, ExpenseIncome, UserPurge
+from .metrics import MetricsMiddleware
+from .pagination import ExpenseIncomeCursorPagination
+from .purges import BATCH_SIZE, run_purge
+from .renderers import FastJSONRenderer
+from .search import SEARCH_BACKENDS
+from .serializers import ExpenseIncomeRowSerializer, ExpenseIncomeSerializer
+from .throttling import UserCounterRateThrottle
+
+SCENARIOS = {}
+
+
+def scenario(name, default_rows):
+    def register(func):
+        SCENARIOS[name] = (func, default_rows)
+        return func
+    return register
+
+
+# Seeded titles and descriptions draw from these, so searches have selective terms.
+TITLE_WORDS = [
+    'groceries', 'rent', 'coffee', 'salary', 'fuel', 'insurance', 'pharmacy', 'cinema', 'books', 'gym',
+    'electricity', 'water', 'internet', 'phone', 'taxi', 'train', 'flight', 'hotel', 'restaurant', 'bakery',
+]
+DESCRIPTION_WORDS = ['monthly', 'weekly', 'refund', 'shared', 'office', 'travel', 'family', 'gift', 'repair']
+
+
+def seed_expenses(user, count, batch_size=5000):
+    """Bulk insert `count` expenses for `user`, one second apart."""
+    start = timezone.now() - timedelta(seconds=count)
+    for offset in range(0, count, batch_size):
+        batch = [
+            ExpenseIncome(
+                user=user,
+                title=f'{TITLE_WORDS[i % len(TITLE_WORDS)].title()} {i}',
+                description=f'{DESCRIPTION_WORDS[i % len(DESCRIPTION_WORDS)]} seeded by benchmark',
+                amount=(i % 500) + 1,
+                transaction_type='credit' if i % 3 == 0 else 'debit',
+                tax=i % 20,
+                tax_type='flat' if i % 2 else 'percentage',
+            )
+            for i in range(offset, min(offset + batch_size, count))
+        ]
+        ExpenseIncome.objects.bulk_create(batch)
+        # created_at is auto_now_add, so spread the timestamps afterwards.
+        for i, obj in enumerate(batch, start=offset):
+            obj.created_at = start + timedelta(seconds=i)
+        ExpenseIncome.objects.bulk_update(batch, ['created_at'], batch_size=1000)
+
+
+def measure(func, repeat):
+    """Call `func` `repeat` times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(stdout, label, timings):
+    stdout.write(
+        f'{label:<40} median {statistics.median(timings):8.2f} ms   '
+        f'min {min(timings):8.2f} ms'
+    )
+
+
+def jwt_client(user):
+    """An APIClient that authenticates like real traffic, with a bearer token."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+def expense_payload(i):
+    return {
+        'title': f'Imported {i}',
+        'amount': f'{(i % 500) + 1}.25',
+        'transaction_type': 'credit' if i % 3 == 0 else 'debit',
+        'tax': str(i % 20),
+        'tax_type': 'flat' if i % 2 else 'percentage',
+    }
+
+
+def get_ok(client, url):
+    # Measure the query path, not the response cache.
+    caches['responses'].clear()
+    response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+@scenario('pagination', default_rows=60000)
+def pagination(stdout, rows, repeat):
+    """Page 1 vs a deep page, with OFFSET pagination and with cursors."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    seed_expenses(user, rows)
+    client = APIClient()
+    client.force_authenticate(user)
+
+    page_size = ExpenseIncomeCursorPagination.page_size
+    deep_page = max(rows // page_size, 1)
+    url = '/api/expenses/'
+
+    # The cursor for page N points just past the last row of page N - 1.
+    paginator = ExpenseIncomeCursorPagination()
+    paginator.base_url = f'http://testserver{url}?pagination=cursor'
+    last_of_previous = (
+        ExpenseIncome.objects.filter(user=user)
+        .order_by('-created_at')
+        .values_list('created_at', flat=True)[(deep_page - 1) * page_size - 1]
+        if deep_page > 1 else None
+    )
+    deep_cursor_url = paginator.encode_cursor(
+        Cursor(offset=0, reverse=False, position=str(last_of_previous) if last_of_previous else None)
+    )
+
+    stdout.write(f'{rows} rows, page size {page_size}, deep page {deep_page}')
+    report(stdout, 'page number: page 1', measure(lambda: get_ok(client, url), repeat))
+    report(stdout, f'page number: page {deep_page}',
+           measure(lambda: get_ok(client, f'{url}?page={deep_page}'), repeat))
+    report(stdout, 'cursor: page 1',
+           measure(lambda: get_ok(client, f'{url}?pagination=cursor'), repeat))
+    report(stdout, f'cursor: page {deep_page}', measure(lambda: get_ok(client, deep_cursor_url), repeat))
+
+
+@scenario('bulk', default_rows=10000)
+def bulk(stdout, rows, repeat):
+    """Import throughput: one POST per row vs the bulk endpoint."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    client = jwt_client(user)
+    # Stay under the 1000/hour user throttle; the rate extrapolates linearly.
+    singles = min(rows, 500)
+    started = time.perf_counter()
+    for i in range(singles):
+        response = client.post('/api/expenses/', expense_payload(i), format='json')
+        assert response.status_code == 201, response.status_code
+    single_rate = singles / (time.perf_counter() - started)
+
+    items = [expense_payload(i) for i in range(rows)]
+    started = time.perf_counter()
+    response = client.post('/api/expenses/bulk/', items, format='json')
+    assert response.status_code == 201, response.status_code
+    bulk_rate = rows / (time.perf_counter() - started)
+
+    stdout.write(f'{rows} rows')
+    stdout.write(f'{"single POSTs (" + str(singles) + " sampled)":<40} {single_rate:10.0f} rows/s')
+    stdout.write(f'{"bulk POST":<40} {bulk_rate:10.0f} rows/s')
+    stdout.write(f'{"speedup":<40} {bulk_rate / single_rate:10.1f}x')
+
+
+@scenario('throttle', default_rows=1000)
+def throttle(stdout, rows, repeat):
+    """Per-request cost of DRF's history throttle vs the counter throttle at 1000/hour."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    request = type('Request', (), {'user': user})()
+    stdout.write(f'{rows} requests per run, rate {UserRateThrottle().rate}')
+    for label, throttle_class in [('history throttle', UserRateThrottle),
+                                  ('counter throttle', UserCounterRateThrottle)]:
+        def run():
+            cache.clear()
+            for _ in range(rows):
+                throttle_class().allow_request(request, None)
+
+        def at_limit():
+            # The window is already full: what every request costs once a client is throttled.
+            for _ in range(100):
+                throttle_class().allow_request(request, None)
+
+        report(stdout, f'{label}: {rows} requests', measure(run, repeat))
+        report(stdout, f'{label}: 100 at the limit', measure(at_limit, repeat))
+    cache.clear()
+
+
+@scenario('search', default_rows=1_000_000)
+def search(stdout, rows, repeat):
+    """?search= through the full-text index vs SearchFilter's LIKE scan."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    seed_expenses(user, rows)
+    client = APIClient()
+    client.force_authenticate(user)
+    url = '/api/expenses/'
+
+    stdout.write(f'{rows} rows')
+    for term in ['cinema', 'coffee refund', 'nothing']:
+        search_url = f'{url}?search={term}'
+        report(stdout, f'full-text: {term!r}', measure(lambda: get_ok(client, search_url), repeat))
+        # Without a backend ExpenseSearchFilter falls back to SearchFilter's icontains.
+        with mock.patch.dict(SEARCH_BACKENDS, clear=True):
+            report(stdout, f'LIKE: {term!r}', measure(lambda: get_ok(client, search_url), repeat))
+
+
+@scenario('serializer', default_rows=1000)
+def serializer(stdout, rows, repeat):
+    """Fetch, serialize and render a list page: model instances vs .values() rows."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    seed_expenses(user, rows)
+    queryset = ExpenseIncome.objects.filter(user=user).order_by('-created_at')
+    renderer = JSONRenderer()
+    paths = [
+        ('ExpenseIncomeSerializer', ExpenseIncomeSerializer, lambda page: list(queryset[:page])),
+        ('ExpenseIncomeRowSerializer', ExpenseIncomeRowSerializer,
+         lambda page: list(queryset.values(*ExpenseIncomeRowSerializer.row_fields)[:page])),
+    ]
+    stdout.write(f'{rows} rows')
+    for page_size in [10, 100, 1000]:
+        page_size = min(page_size, rows)
+        for label, serializer_class, fetch in paths:
+            timings = measure(lambda: renderer.render(serializer_class(fetch(page_size), many=True).data), repeat)
+            rate = page_size / (statistics.median(timings) / 1000)
+            stdout.write(f'{label + ": page " + str(page_size):<40} {rate:10.0f} rows/s   '
+                         f'median {statistics.median(timings):8.2f} ms')
+
+
+@scenario('renderer', default_rows=5000)
+def renderer(stdout, rows, repeat):
+    """Render time and payload size of large list pages: JSONRenderer vs FastJSONRenderer, plus gzip."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    seed_expenses(user, rows)
+    queryset = ExpenseIncome.objects.filter(user=user).order_by('-created_at')
+    stdout.write(f'{rows} rows')
+    for page_size in sorted({min(size, rows) for size in [100, 1000, 5000]}):
+        rows_page = queryset.values(*ExpenseIncomeRowSerializer.row_fields)[:page_size]
+        data = ExpenseIncomeRowSerializer(list(rows_page), many=True).data
+        for label, renderer_class in [('JSONRenderer', JSONRenderer), ('FastJSONRenderer', FastJSONRenderer)]:
+            body = renderer_class().render(data)
+            report(stdout, f'{label}: page {page_size} ({len(body) // 1024} KiB)',
+                   measure(lambda: renderer_class().render(data), repeat))
+        compressed = compress_string(body)
+        report(stdout, f'gzip: page {page_size} ({len(compressed) // 1024} KiB)',
+               measure(lambda: compress_string(body), repeat))
+
+
+@scenario('metrics', default_rows=1000)
+def metrics(stdout, rows, repeat):
+    """Cost of MetricsMiddleware on the list endpoint."""
+    user = User.objects.create_user(username='bench', password='bench@@@1234567')
+    seed_expenses(user, rows)
+    url = '/api/expenses/'
+    without = [name for name in settings.MIDDLEWARE if name != 'expenses_app.metrics.MetricsMiddleware']
+    clients = {}
+    for label, middleware in [('without metrics', without), ('with metrics', settings.MIDDLEWARE)]:
+        # The handler loads MIDDLEWARE on its first request.
+        with override_settings(MIDDLEWARE=middleware):
+            clients[label] = jwt_client(user)
+            get_ok(clients[label], url)
+    # Alternate the two so drift affects both equally.
+    timings = {label: [] for label in clients}
+    for _ in range(repeat):
+        cache.clear()  # Reset the throttle, untimed.
+        for label, client in clients.items():
+            timings[label] += measure(lambda: get_ok(client, url), 1)
+    stdout.write(f'{rows} rows, {repeat} requests each')
+    for label, values in timings.items():
+        report(stdout, f'list: {label}', values)
+    overhead = statistics.median(timings['with metrics']) / statistics.median(timings['without metrics']) - 1
+    stdout.write(f'{"overhead":<40} {overhead * 100:8.2f} %')
+
+    # End to end the difference is within run-to-run noise, so also time the
+    # middleware alone around a stub view that runs three queries.
+    stub_response = HttpResponse(b'x' * 2000)
+    request = RequestFactory().get(url)
+
+    def stub_view(request):
+        request.resolver_match = resolve(url)
+        with connection.cursor() as cursor:
+            for _ in range(3):
+                cursor.execute('SELECT 1')
+        return stub_response
+
+    middleware = MetricsMiddleware(stub_view)
+    bare = statistics.median(measure(lambda: [stub_view(request) for _ in range(1000)], repeat))
+    measured = statistics.median(measure(lambda: [middleware(request) for _ in range(1000)], repeat))
+    cost = measured - bare  # ms per 1000 requests = us per request
+    stdout.write(f'{"middleware alone":<40} {cost:8.1f} us per request   '
+                 f'{cost / 10 / statistics.median(timings["without metrics"]):8.2f} % of a list request')
+
+
+def report_latencies(stdout, label, timings):
+    p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+    stdout.write(
+        f'{label:<40} {len(timings):6d} req   p50 {statistics.median(timings):8.2f} ms   p99 {p99:8.2f} ms'
+    )
+
+
+@scenario('load', default_rows=40000)
+def load(stdout, rows, repeat, users=20):
+    """
+    Mixed API traffic: `users` users register and log in, then browse, search
+    and edit their share of `rows` seeded expenses, `repeat` * 100 requests in
+    all. Reports p50/p99 per endpoint and throughput, to compare releases.
+    """
+    rng = random.Random(0)
+    latencies = defaultdict(list)
+
+    def timed(name, call, expected_status):
+        started = time.perf_counter()
+        response = call()
+        latencies[name].append((time.perf_counter() - started) * 1000)
+        assert response.status_code == expected_status, (name, response.status_code)
+        return response
+
+    anonymous = APIClient()
+    ledgers = []
+    for n in range(users):
+        credentials = {'username': f'load{n}', 'password': 'load@@@1234567'}
+        timed('register', lambda: anonymous.post('/api/auth/register/', credentials, format='json'), 201)
+        token = timed('login', lambda: anonymous.post('/api/auth/login/', credentials, format='json'), 200)
+        user = User.objects.get(username=credentials['username'])
+        seed_expenses(user, rows // users)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.data["access"]}')
+        ledgers.append((client, list(ExpenseIncome.objects.filter(user=user).values_list('pk', flat=True))))
+
+    url = '/api/expenses/'
+    payload = {'title': 'Coffee', 'amount': '3.50', 'transaction_type': 'debit', 'tax': '5', 'tax_type': 'percentage'}
+
+    def create(client, ids):
+        ids.append(timed('create', lambda: client.post(url, payload, format='json'), 201).data['id'])
+
+    def delete(client, ids):
+        pk = ids.pop(rng.randrange(len(ids)))
+        timed('delete', lambda: client.delete(f'{url}{pk}/'), 204)
+
+    operations = [  # (weight, operation)
+        (30, lambda client, ids: timed('list', lambda: client.get(url), 200)),
+        (10, lambda client, ids: timed('list: page 20', lambda: client.get(url, {'page': 20}), 200)),
+        (10, lambda client, ids: timed('list: filtered', lambda: client.get(url, {'transaction_type': 'credit'}), 200)),
+        (10, lambda client, ids: timed('list: search', lambda: client.get(url, {'search': rng.choice(TITLE_WORDS)}), 200)),
+        (20, lambda client, ids: timed('retrieve', lambda: client.get(f'{url}{rng.choice(ids)}/'), 200)),
+        (8, create),
+        (7, lambda client, ids: timed(
+            'update', lambda: client.patch(f'{url}{rng.choice(ids)}/', {'amount': '12.00'}, format='json'), 200)),
+        (3, delete),
+        (2, lambda client, ids: timed('summary', lambda: client.get(f'{url}summary/'), 200)),
+    ]
+    weights, functions = zip(*operations)
+    requests = repeat * 100
+    cache.clear()  # Registration and login count against the anonymous throttle.
+    started = time.perf_counter()
+    for _ in range(requests):
+        client, ids = rng.choice(ledgers)
+        rng.choices(functions, weights)[0](client, ids)
+    elapsed = time.perf_counter() - started
+
+    stdout.write(f'{rows} rows, {users} users, {requests} mixed requests')
+    for name, timings in sorted(latencies.items()):
+        report_latencies(stdout, name, timings)
+    mixed = [timing for name, timings in latencies.items() if name not in ('register', 'login') for timing in timings]
+    report_latencies(stdout, 'all mixed requests', mixed)
+    stdout.write(f'{"throughput":<40} {requests / elapsed:8.0f} req/s')
+
+
+@scenario('sync', default_rows=20000)
+def sync(stdout, rows, repeat):
+    """A full download of the ledger vs a change-feed sync after a small edit."""
+    user = User.objects.create_user(username='bench')
+    seed_expenses(user, rows)
+    client = jwt_client(user)
+    url = '/api/expenses/changes/'
+
+    def follow(since=None):
+        transferred = 0
+        while True:
+            response = client.get(url, {'since': since, 'page_size': 5000} if since else {'page_size': 5000})
+            assert response.status_code == 200, response.status_code
+            transferred += len(response.content)
+            since = response.data['next']
+            if not response.data['has_more']:
+                return since, transferred
+
+    token, full_bytes = follow()
+    report(stdout, f'full sync ({full_bytes // 1024} KiB)', measure(follow, repeat))
+    for obj in ExpenseIncome.objects.filter(user=user).order_by('?')[:5]:
+        obj.amount += 1
+        obj.save()
+    ExpenseIncome.objects.filter(user=user).order_by('?')[:1].get().delete()
+    _, delta_bytes = follow(token)
+    report(stdout, f'sync after 5 edits, 1 delete ({delta_bytes} B)', measure(lambda: follow(token), repeat))
+
+
+@scenario('archive', default_rows=200000)
+def archive(stdout, rows, repeat, recent=2000):
+    """List latency for a long-lived account, before and after archiving its old records."""
+    user = User.objects.create_user(username='bench')
+    seed_expenses(user, rows)
+    # All but the newest `recent` records are three years old.
+    cutoff = ExpenseIncome.objects.filter(user=user).order_by('-created_at').values_list('pk', flat=True)[recent - 1]
+    ExpenseIncome.objects.filter(user=user, pk__lt=cutoff).update(created_at=F('created_at') - timedelta(days=1100))
+    client = jwt_client(user)
+    month_ago = (timezone.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    urls = [
+        ('list, page 1', '/api/expenses/'),
+        ('list, last 30 days', f'/api/expenses/?created_at__gte={month_ago}'),
+        ('list, all time', f'/api/expenses/?created_at__lte={timezone.now():%Y-%m-%d}T23:59'),
+    ]
+
+    stdout.write(f'{rows} records, {recent} from the last month')
+    for label, url in urls:
+        report(stdout, f'{label}, not archived', measure(lambda: get_ok(client, url), repeat))
+    started = time.perf_counter()
+    moved = ArchivedExpense.objects.archive(ArchivedExpense.objects.horizon())
+    stdout.write(f'archived {moved} records in {time.perf_counter() - started:.1f} s')
+    for label, url in urls:
+        report(stdout, f'{label}, archived', measure(lambda: get_ok(client, url), repeat))
+
+
+@scenario('purge', default_rows=1_000_000)
+def purge(stdout, rows, repeat):
+    """Deleting a heavy account: User.delete()'s cascade vs the batched purge."""
+
+    def timed(label, func):
+        tracemalloc.start()
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stdout.write(f'{label:<40} {elapsed:8.2f} s   peak memory {peak / 2**20:8.1f} MiB')
+
+    for label in ('cascade (User.delete())', 'purge'):
+        user = User.objects.create_user(username='bench')
+        seed_expenses(user, rows)
+        if label == 'purge':
+            UserPurge.objects.request(user)
+            timed(label, lambda: run_purge(UserPurge.objects.claim()))
+        else:
+            timed(label, user.delete)
+    # The cascade is one transaction, so it holds the write lock throughout;
+    # each purge batch holds it for one DELETE of BATCH_SIZE rows.
+    batch_user = User.objects.create_user(username='batch')
+    seed_expenses(batch_user, BATCH_SIZE)
+    UserPurge.objects.request(batch_user)
+    timed(f'purge, one batch of {BATCH_SIZE}', lambda: run_purge(UserPurge.objects.claim()))
+
+
+async def asgi_get(app, url, token, read_seconds=0):
+    """
+    GET `url` from the ASGI application `app` the way a server would, taking
+    `read_seconds` to send the response body to the client. Returns the status code.
+    """
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    requested = False
+    finished = asyncio.Event()
+    status_code = None
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect until it has responded.
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status_code
+        if message['type'] == 'http.response.start':
+            status_code = message['status']
+        elif not message.get('more_body'):
+            await asyncio.sleep(read_seconds)
+            finished.set()
+
+    await app(scope, receive, send)
+    return status_code
+
+
+@scenario('asgi', default_rows=20000)
+def asgi(stdout, rows, repeat, concurrency=500, users=50, threads=16, slow_client_seconds=0.2):
+    """
+    `concurrency` requests arriving at once, `repeat` // 5 times, spread over
+    `users` users: the sync views behind a WSGI server with `threads` threads,
+    the same views under ASGI, and the async views under ASGI. Latency counts
+    from the moment the batch arrives, so it includes waiting for a thread.
+    Slow clients take `slow_client_seconds` to read each response, which
+    holds a WSGI thread but not the event loop.
+    """
+    rng = random.Random(0)
+    ledgers = []
+    for n in range(users):
+        user = User.objects.create_user(username=f'asgi{n}')
+        seed_expenses(user, rows // users)
+        ids = list(ExpenseIncome.objects.filter(user=user).values_list('pk', flat=True))
+        ledgers.append((str(RefreshToken.for_user(user).access_token), ids))
+
+    application = get_asgi_application()
+    local = threading.local()
+
+    def run_wsgi(pool, batch, read_seconds):
+        started = time.perf_counter()
+
+        def call(request):
+            url, token = request
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            status_code = local.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code
+            time.sleep(read_seconds)
+            return status_code, (time.perf_counter() - started) * 1000
+        return list(pool.map(call, batch)), time.perf_counter() - started
+
+    def run_asgi(pool, batch, read_seconds):
+        async def run():
+            started = time.perf_counter()
+
+            async def call(request):
+                status_code = await asgi_get(application, *request, read_seconds)
+                return status_code, (time.perf_counter() - started) * 1000
+            results = await asyncio.gather(*(call(request) for request in batch))
+            return results, time.perf_counter() - started
+        return asyncio.run(run())
+
+    modes = [  # (label, list URL, runner)
+        ('WSGI, sync views', '/api/expenses/', run_wsgi),
+        ('ASGI, sync views', '/api/expenses/', run_asgi),
+        ('ASGI, async views', '/api/async/expenses/', run_asgi),
+    ]
+    workloads = [  # (label, URL for the list URL, a user's ids and a request number, client read time)
+        # Response cache hits after one warm-up request per user.
+        ('cached list', lambda url, ids, i: url, 0),
+        # A unique parameter keeps every retrieve out of the response cache.
+        ('retrieve', lambda url, ids, i: f'{url}{rng.choice(ids)}/?n={i}', 0),
+        # The cached list again, for clients that read slowly.
+        ('slow clients', lambda url, ids, i: url, slow_client_seconds),
+    ]
+    rounds = max(1, repeat // 5)
+    stdout.write(f'{rows} rows, {users} users, {rounds} x {concurrency} concurrent requests, {threads} WSGI threads')
+    # Queued requests are slow by design here; don't log every one of them.
+    with ThreadPoolExecutor(threads) as pool, override_settings(SLOW_REQUEST_BUDGET_MS=float('inf')):
+        for workload, make_url, read_seconds in workloads:
+            for label, url, runner in modes:
+                latencies = []
+                elapsed = 0
+                for round_number in range(rounds):
+                    cache.clear()  # Reset the throttle, untimed.
+                    runner(pool, [(make_url(url, ids, -1), token) for token, ids in ledgers], 0)
+                    batch = []
+                    for i in range(concurrency):
+                        token, ids = ledgers[i % users]
+                        batch.append((make_url(url, ids, round_number * concurrency + i), token))
+                    results, seconds = runner(pool, batch, read_seconds)
+                    assert all(status_code == 200 for status_code, _ in results), {code for code, _ in results}
+                    latencies += [latency for _, latency in results]
+                    elapsed += seconds
+                report_latencies(stdout, f'{workload}: {label}', latencies)
+                stdout.write(f'{"":<40} {len(latencies) / elapsed:6.0f} req/s')
@@ -0,0 +1,164 @@
+"""
+Per-user versioned response cache for ExpenseIncomeViewSet.
+
+Every write to a user's expenses bumps that user's data version. Cached
+list/retrieve payloads are keyed by the version, so one write makes all of
+the user's entries unreachable at once, and the bounded `responses` cache
+evicts them in LRU order. The ETag is derived from the same key, so a
+matching If-None-Match is answered with a 304 before the cache body or the
+database is read.
+
+The versions live in the `versions` cache, which every process shares (see
+settings), so a write made by a worker or another server process
+invalidates this one's entries too. settings.RESPONSE_CACHE_ENABLED turns
+response caching off.
+
+Misses are read from the primary even when the view reads from replicas: a
+lagging replica could return rows from before a write whose version bump has
+already happened, and they would be cached under the new version.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.cache import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .db_routers import read_from_primary
+
+RESPONSE_CACHE_ALIAS = 'responses'
+VERSION_CACHE_ALIAS = 'versions'
+
+
+def version_key(user_id):
+    return f'expense-data-version:{user_id}'
+
+
+def data_version(user_id):
+    cache = caches[VERSION_CACHE_ALIAS]
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock, so a version lost to eviction can never come
+        # back to a value that older entries were stored under.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_versions(user_ids, using=None):
+    """Invalidate the cached responses of `user_ids`."""
+    user_ids = set(user_ids)
+
+    def bump():
+        cache = caches[VERSION_CACHE_ALIAS]
+        for user_id in user_ids:
+            try:
+                cache.incr(version_key(user_id))
+            except ValueError:
+                pass  # No version yet, so nothing is cached for this user.
+
+    bump()
+    # Bump again on commit: a request that read the old rows after the first
+    # bump would otherwise have cached them under the current version.
+    if transaction.get_connection(using or DEFAULT_DB_ALIAS).in_atomic_block:
+        transaction.on_commit(bump, using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+def reset_data_version(sender, instance, created, **kwargs):
+    # A new account has no data; don't inherit entries from a reused id.
+    if created:
+        caches[VERSION_CACHE_ALIAS].delete(version_key(instance.pk))
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: self._counts[name] for name in ('hits', 'misses', 'not_modified')}
+
+
+# Per process; exposed by ExpenseIncomeViewSet.cache_stats.
+response_cache_stats = CacheStats()
+
+
+class CachedResponseMixin:
+    """
+    Serve `list` and `retrieve` from the response cache. Superusers see every
+    user's data, which no single version covers, so they are never cached.
+    """
+
+    def caches_response(self, request):
+        return settings.RESPONSE_CACHE_ENABLED and not request.user.is_superuser
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_cache_key(self, request, version):
+        params = sorted(request.query_params.lists())
+        parts = (request.user.pk, version, request.get_host(), request.path, params,
+                 request.accepted_renderer.format)
+        return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.caches_response(request):
+            return handler(request, *args, **kwargs)
+        key, response = self.lookup_response(request)
+        if response is None:
+            read_from_primary()
+            response = self.store_response(key, handler(request, *args, **kwargs))
+        return response
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """cached_response() for an async handler."""
+        if not self.caches_response(request):
+            return await handler(request, *args, **kwargs)
+        # The versions cache blocks on disk or Redis, so it is read in a thread.
+        key, response = await sync_to_async(self.lookup_response)(request)
+        if response is None:
+            read_from_primary()
+            response = self.store_response(key, await handler(request, *args, **kwargs))
+        return response
+
+    def lookup_response(self, request):
+        """The cache key, and the 304 or cached response if there is one."""
+        key = self.response_cache_key(request, data_version(request.user.pk))
+        etag = f'"{key}"'
+        # Weak comparison: GZipMiddleware sends the ETag back as W/"...".
+        if etag in {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}:
+            response_cache_stats.incr('not_modified')
+            return key, Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        data = caches[RESPONSE_CACHE_ALIAS].get(key)
+        if data is None:
+            response_cache_stats.incr('misses')
+            return key, None
+        response_cache_stats.incr('hits')
+        return key, Response(data, headers={'X-Cache': 'HIT', 'ETag': etag})
+
+    def store_response(self, key, response):
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        caches[RESPONSE_CACHE_ALIAS].set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        response['ETag'] = f'"{key}"'
+        return response
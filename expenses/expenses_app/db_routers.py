@@ -0,0 +1,92 @@
+"""
+Primary/replica database routing.
+
+Writes always go to `default`. Reads go to one of settings.DATABASE_REPLICAS
+only during a request whose view opted in with read_from_replica(), and only
+until that request writes: from the first write on, every read goes to the
+primary as well, so a request always sees its own writes.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    __slots__ = ('replica_reads', 'wrote')
+
+    def __init__(self):
+        self.replica_reads = False
+        self.wrote = False
+
+
+class DatabaseRoutingMiddleware:
+    """Gives every request fresh routing state, so nothing leaks between requests."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _state.set(RoutingState())
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+
+    async def __acall__(self, request):
+        # Async ORM calls run in a worker thread with a copy of this context,
+        # which shares the RoutingState object, so writes there are seen here.
+        token = _state.set(RoutingState())
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+
+
+def read_from_replica():
+    """Let the rest of the current request read from a replica."""
+    state = _state.get()
+    if state is not None:
+        state.replica_reads = True
+
+
+def read_from_primary():
+    """Send the rest of the current request's reads back to the primary."""
+    state = _state.get()
+    if state is not None:
+        state.replica_reads = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or not state.replica_reads or state.wrote or not replicas:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,18 @@
+import django_filters
+
+from .models import ExpenseIncome
+
+
+class ExpenseIncomeFilter(django_filters.FilterSet):
+    # `total` is the database-side alias added by ExpenseIncomeQuerySet.with_total().
+    total__gte = django_filters.NumberFilter(field_name='total', lookup_expr='gte')
+    total__lte = django_filters.NumberFilter(field_name='total', lookup_expr='lte')
+
+    class Meta:
+        model = ExpenseIncome
+        fields = {
+            'transaction_type': ['exact'],
+            'tax_type': ['exact'],
+            'created_at': ['exact', 'gte', 'lte'],
+            'updated_at': ['exact'],
+        }
@@ -0,0 +1,91 @@
+"""
+Background CSV import.
+
+Uploads are stored with an ImportJob and worked by `manage.py process_imports`.
+The file is read as a text stream with csv.DictReader and written with
+bulk_create in batches, so a year of bank statements never sits in memory
+or holds up a request. Each batch commits with the job's counters, so a job
+whose worker died is claimed again and resumes after the rows already
+counted. The upload is deleted when the job finishes either way.
+"""
+import csv
+import io
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import ExpenseIncome, ImportJob
+from .serializers import ExpenseIncomeSerializer
+
+IMPORT_FIELDS = ['title', 'description', 'amount', 'transaction_type', 'tax', 'tax_type']
+REQUIRED_COLUMNS = ['title', 'amount', 'transaction_type']
+
+BATCH_SIZE = 1000
+
+# Only the first errors are kept on the job; rows_failed has the full count.
+MAX_ERRORS = 100
+
+
+class ImportFileError(Exception):
+    """The upload cannot be read at all (encoding, missing columns)."""
+
+
+def read_rows(file):
+    """Yield (line number, field dict) for each CSV record in `file`."""
+    with file.open('rb') as raw:
+        reader = csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+        for row in reader:
+            # Blank cells fall back to the model defaults (tax, tax_type).
+            yield reader.line_num, {name: row[name] for name in IMPORT_FIELDS if row.get(name)}
+
+
+def run_job(job, batch_size=BATCH_SIZE):
+    """Import a claimed job's file and record the outcome on the job."""
+    try:
+        import_rows(job, batch_size)
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+        job.status, job.detail = ImportJob.FAILED, str(exc)
+    else:
+        job.status = ImportJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'detail', 'finished_at', 'updated_at'])
+    # Only once the outcome is saved: a job that is claimed again needs its file.
+    job.file.delete(save=False)
+    job.save(update_fields=['file', 'updated_at'])
+    return job
+
+
+def import_rows(job, batch_size):
+    validator = ExpenseIncomeSerializer()
+    batch = []
+    # Rows a previous worker counted are already in the ledger (see flush).
+    done = job.rows_processed
+    for number, (line, data) in enumerate(read_rows(job.file), start=1):
+        if number <= done:
+            continue
+        job.rows_processed += 1
+        try:
+            attrs = validator.run_validation(data)
+        except serializers.ValidationError as exc:
+            job.rows_failed += 1
+            if len(job.errors) < MAX_ERRORS:
+                job.errors.append({'line': line, 'errors': exc.detail})
+        else:
+            batch.append(ExpenseIncome(user_id=job.user_id, **attrs))
+        if job.rows_processed % batch_size == 0:
+            flush(job, batch)
+            batch = []
+    flush(job, batch)
+
+
+def flush(job, batch):
+    # The rows and the progress counters commit together, so the job status
+    # always matches what is in the ledger.
+    with transaction.atomic():
+        if batch:
+            ExpenseIncome.objects.bulk_create(batch)
+        job.save(update_fields=['rows_processed', 'rows_failed', 'errors', 'updated_at'])
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expenses_app.models import ArchivedExpense
+
+
+class Command(BaseCommand):
+    help = 'Move expense records older than the archive horizon out of the hot table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EXPENSE_ARCHIVE_AFTER_DAYS,
+                            help='Archive records created more than this many days ago '
+                                 '(at least EXPENSE_ARCHIVE_AFTER_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+
+    def handle(self, *args, **options):
+        if options['days'] < settings.EXPENSE_ARCHIVE_AFTER_DAYS:
+            # Lists only look in the archive for dates past the horizon.
+            raise CommandError(f'--days must be at least EXPENSE_ARCHIVE_AFTER_DAYS '
+                               f'({settings.EXPENSE_ARCHIVE_AFTER_DAYS}).')
+        before = timezone.now() - timedelta(days=options['days'])
+        moved = ArchivedExpense.objects.archive(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} record(s) created before {before:%Y-%m-%d}.'))
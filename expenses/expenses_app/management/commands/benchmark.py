@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from expenses_app.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--rows', type=int, help='Number of rows to seed (scenario default if omitted).')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed iterations per measurement.')
+
+    def handle(self, *args, **options):
+        func, default_rows = SCENARIOS[options['scenario']]
+        # DEBUG=False like production; with DEBUG on every query is logged.
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            func(self.stdout, options['rows'] or default_rows, options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
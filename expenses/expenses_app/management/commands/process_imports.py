@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses_app.imports import BATCH_SIZE, run_job
+from expenses_app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = 'Work the CSV import queue: claim pending jobs one at a time and import them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling.')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds between polls of an empty queue.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT/commit.')
+
+    def handle(self, *args, **options):
+        while True:
+            job = ImportJob.objects.claim()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            run_job(job, batch_size=options['batch_size'])
+            self.stdout.write(
+                f'Import {job.pk}: {job.status}, {job.rows_processed} row(s), {job.rows_failed} failed.'
+            )
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses_app.models import UserPurge
+from expenses_app.purges import BATCH_SIZE, run_purge
+
+
+class Command(BaseCommand):
+    help = 'Work the account purge queue: claim requested purges one at a time and delete the accounts in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling.')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds between polls of an empty queue.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per DELETE/commit.')
+
+    def handle(self, *args, **options):
+        while True:
+            purge = UserPurge.objects.claim()
+            if purge is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            run_purge(purge, batch_size=options['batch_size'])
+            self.stdout.write(f'Purge of user {purge.user_id}: {purge.status}, {purge.rows_deleted} row(s) deleted.')
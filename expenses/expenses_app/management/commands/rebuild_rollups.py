@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from expenses_app.models import ExpenseRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily expense rollups used by the analytics endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only rebuild this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per grouped query.')
+
+    def handle(self, *args, **options):
+        rebuilt = ExpenseRollup.objects.rebuild(user_ids=options['user_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} rollup row(s).'))
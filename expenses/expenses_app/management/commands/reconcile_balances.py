@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from expenses_app.models import UserBalance
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user balances from the expense ledger and repair any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Only reconcile this user id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users per grouped query.')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing.')
+
+    def handle(self, *args, **options):
+        drifted = UserBalance.objects.reconcile(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drifted)} drifted balance(s).'))
+        if drifted and options['verbosity'] > 1:
+            self.stdout.write('User ids: ' + ', '.join(map(str, drifted)))
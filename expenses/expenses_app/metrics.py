@@ -0,0 +1,282 @@
+"""
+Request metrics for the API views.
+
+MetricsMiddleware measures every request to a DRF view: latency, database
+queries and their time (through an execute wrapper installed on every
+connection), time spent in the timed serializers and response size. The numbers go to per-view
+histograms in this process, exposed in Prometheus text format at /metrics,
+and to a `Server-Timing` header on the response. Requests over
+settings.SLOW_REQUEST_BUDGET_MS are logged with their SQL.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .caching import response_cache_stats
+
+logger = logging.getLogger(__name__)
+
+_timing = ContextVar('request_timing', default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# SQL kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 50
+
+
+class RequestTiming:
+    """What one request spent, filled in while it runs."""
+    __slots__ = ('queries', 'db_seconds', 'serialize_seconds', 'sql')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += elapsed
+            if len(self.sql) < MAX_LOGGED_QUERIES:
+                self.sql.append((sql, elapsed))
+
+
+def record_query(execute, sql, params, many, context):
+    timing = _timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Installed once per connection rather than per request: async views run
+    # their queries on another thread's connection, but in the request's context.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serialization():
+    """Count the enclosed time as serialization, if the request is measured."""
+    timing = _timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.serialize_seconds += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+    """Adds the time spent building `.data` to the request's serialization time."""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf."""
+        cumulative = 0
+        for bound, count in zip([*self.buckets, '+Inf'], self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+def format_labels(labels):
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+class RequestMetrics:
+    histograms = {
+        'request_duration_seconds': ('Request latency.', LATENCY_BUCKETS),
+        'db_queries': ('Database queries per request.', QUERY_COUNT_BUCKETS),
+        'db_duration_seconds': ('Time spent in database queries per request.', LATENCY_BUCKETS),
+        'serialize_duration_seconds': ('Time spent in serializers per request.', LATENCY_BUCKETS),
+        'response_size_bytes': ('Response body size (after compression), streaming bodies excluded.',
+                                SIZE_BUCKETS),
+    }
+
+    def __init__(self, prefix='expenses'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._histograms = {}
+
+    def record(self, view, method, status_code, duration, timing, size):
+        labels = (('view', view), ('method', method))
+        observations = {
+            'request_duration_seconds': duration,
+            'db_queries': timing.queries,
+            'db_duration_seconds': timing.db_seconds,
+            'serialize_duration_seconds': timing.serialize_seconds,
+            'response_size_bytes': size,
+        }
+        with self._lock:
+            key = (*labels, ('status', status_code))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in observations.items():
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[name, labels] = Histogram(self.histograms[name][1])
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """All series in Prometheus text exposition format."""
+        lines = []
+        name = f'{self.prefix}_requests_total'
+        lines += [f'# HELP {name} Requests handled by this process.', f'# TYPE {name} counter']
+        with self._lock:
+            lines += [f'{name}{format_labels(labels)} {count}' for labels, count in sorted(self._requests.items())]
+            for metric, (help_text, _) in self.histograms.items():
+                name = f'{self.prefix}_{metric}'
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (series, labels), histogram in sorted(self._histograms.items()):
+                    if series != metric:
+                        continue
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{format_labels([*labels, ("le", bound)])} {count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {sum(histogram.counts)}')
+        name = f'{self.prefix}_response_cache_total'
+        lines += [f'# HELP {name} Response cache lookups by result.', f'# TYPE {name} counter']
+        for result, count in response_cache_stats.snapshot().items():
+            lines.append(f'{name}{format_labels([("result", result)])} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Per process, like response_cache_stats.
+request_metrics = RequestMetrics()
+
+
+def view_name(view_func, request):
+    """`ExpenseIncomeViewSet.list` for viewset actions, the class name for other DRF views."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower())
+        if action:
+            return f'{view_class.__name__}.{action}'
+    return view_class.__name__
+
+
+class MetricsMiddleware:
+    """
+    Measures requests to DRF views; other requests (admin, static files,
+    /metrics itself) are not recorded. Works in both sync and async stacks,
+    so async views don't pay for a thread switch here.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timing.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timing)
+
+    async def __acall__(self, request):
+        timing = RequestTiming()
+        token = _timing.set(timing)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timing.reset(token)
+        return self.finish(request, response, time.perf_counter() - started, timing)
+
+    def finish(self, request, response, duration, timing):
+        match = getattr(request, 'resolver_match', None)
+        view = view_name(match.func, request) if match is not None else None
+        if view is None:
+            return response
+
+        size = None if response.streaming else len(response.content)
+        request_metrics.record(view, request.method, response.status_code, duration, timing, size)
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={duration * 1000:.1f}',
+            f'db;dur={timing.db_seconds * 1000:.1f};desc="{timing.queries} queries"',
+            f'serialize;dur={timing.serialize_seconds * 1000:.1f}',
+        ])
+        if duration * 1000 > settings.SLOW_REQUEST_BUDGET_MS:
+            self.log_slow_request(request, view, duration, timing)
+        return response
+
+    def log_slow_request(self, request, view, duration, timing):
+        statements = '\n'.join(f'  {elapsed * 1000:8.1f} ms  {sql}' for sql, elapsed in timing.sql)
+        logger.warning(
+            'Slow request: %s %s (%s) took %.0f ms, %d queries in %.0f ms\n%s',
+            request.method, request.get_full_path(), view, duration * 1000,
+            timing.queries, timing.db_seconds * 1000, statements,
+        )
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. With settings.METRICS_TOKEN set, scrapers
+    must send it as a bearer token; without one it is only served in DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses_app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expenseincome',
+            index=models.Index(fields=['user', '-created_at'], name='expense_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseincome',
+            index=models.Index(fields=['user', 'transaction_type', '-created_at'], name='expense_user_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseincome',
+            index=models.Index(fields=['user', '-amount'], name='expense_user_amount_idx'),
+        ),
+    ]
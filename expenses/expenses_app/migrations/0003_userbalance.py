@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:29
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def total_expression():
+    """ExpenseIncome.total in SQL, as of this migration; see models.total_expression()."""
+    output_field = models.DecimalField(max_digits=20, decimal_places=6)
+    amount = Coalesce(F('amount'), Value(Decimal('0')), output_field=output_field)
+    tax = Coalesce(F('tax'), Value(Decimal('0')), output_field=output_field)
+    return Case(
+        When(tax_type='flat', then=amount + tax),
+        When(tax_type='percentage', then=amount + amount * tax * Value(Decimal('0.01'))),
+        default=amount,
+        output_field=output_field,
+    )
+
+
+def backfill_balances(apps, schema_editor):
+    ExpenseIncome = apps.get_model('expenses_app', 'ExpenseIncome')
+    UserBalance = apps.get_model('expenses_app', 'UserBalance')
+    total = total_expression()
+    rows = ExpenseIncome.objects.order_by().values('user_id').annotate(
+        total_credit=Sum(total, filter=Q(transaction_type='credit'), default=0),
+        total_debit=Sum(total, filter=~Q(transaction_type='credit'), default=0),
+        tax_paid=Sum(total - F('amount'), default=0),
+        count=Count('id'),
+    )
+    UserBalance.objects.bulk_create(UserBalance(**row) for row in rows.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('expenses_app', '0002_expenseincome_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_credit', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('total_debit', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('tax_paid', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:34
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def total_expression():
+    """ExpenseIncome.total in SQL, as of this migration; see models.total_expression()."""
+    output_field = models.DecimalField(max_digits=20, decimal_places=6)
+    amount = Coalesce(F('amount'), Value(Decimal('0')), output_field=output_field)
+    tax = Coalesce(F('tax'), Value(Decimal('0')), output_field=output_field)
+    return Case(
+        When(tax_type='flat', then=amount + tax),
+        When(tax_type='percentage', then=amount + amount * tax * Value(Decimal('0.01'))),
+        default=amount,
+        output_field=output_field,
+    )
+
+
+def backfill_rollups(apps, schema_editor):
+    ExpenseIncome = apps.get_model('expenses_app', 'ExpenseIncome')
+    ExpenseRollup = apps.get_model('expenses_app', 'ExpenseRollup')
+    total = total_expression()
+    rows = ExpenseIncome.objects.order_by().annotate(day=TruncDate('created_at')).values(
+        'user_id', 'day', 'transaction_type', 'tax_type',
+    ).annotate(
+        rollup_count=Count('id'),
+        rollup_amount=Sum('amount'),
+        rollup_tax=Sum(total - F('amount')),
+        rollup_total=Sum(total),
+    )
+    ExpenseRollup.objects.bulk_create(
+        (
+            ExpenseRollup(
+                user_id=row['user_id'], day=row['day'], transaction_type=row['transaction_type'],
+                tax_type=row['tax_type'], count=row['rollup_count'], amount=row['rollup_amount'],
+                tax=row['rollup_tax'], total=row['rollup_total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses_app', '0003_userbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('credit', 'Credit'), ('debit', 'Debit')], max_length=6)),
+                ('tax_type', models.CharField(choices=[('flat', 'Flat'), ('percentage', 'Percentage')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('tax', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('total', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'transaction_type', 'tax_type'), name='expense_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
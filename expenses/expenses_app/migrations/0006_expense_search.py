@@ -0,0 +1,95 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:55
+
+import django.db.models.deletion
+import expenses_app.models
+from django.db import migrations, models
+
+EXPENSE_TABLE = 'expenses_app_expenseincome'
+
+SQLITE_FORWARD = [
+    f"""CREATE VIRTUAL TABLE expense_search USING fts5(
+        title, description, user_id, content='{EXPENSE_TABLE}', content_rowid='id'
+    )""",
+    # Title matches count ten times as much as description matches; user_id
+    # only narrows the search to one ledger.
+    "INSERT INTO expense_search(expense_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 0.0)')",
+    f"""CREATE TRIGGER expense_search_insert AFTER INSERT ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END""",
+    f"""CREATE TRIGGER expense_search_delete AFTER DELETE ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(expense_search, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+    END""",
+    f"""CREATE TRIGGER expense_search_update AFTER UPDATE OF title, description, user_id ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(expense_search, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+        INSERT INTO expense_search(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END""",
+    "INSERT INTO expense_search(expense_search) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS expense_search_insert',
+    'DROP TRIGGER IF EXISTS expense_search_delete',
+    'DROP TRIGGER IF EXISTS expense_search_update',
+    'DROP TABLE IF EXISTS expense_search',
+]
+
+POSTGRES_FORWARD = [
+    f"""CREATE INDEX expense_search_document_idx ON {EXPENSE_TABLE} USING GIN (
+        to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))
+    )""",
+]
+POSTGRES_REVERSE = ['DROP INDEX IF EXISTS expense_search_document_idx']
+
+
+def sqlite_has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def run(statements, schema_editor):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and sqlite_has_fts5(schema_editor):
+        run(SQLITE_FORWARD, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRES_FORWARD, schema_editor)
+    # Elsewhere ?search= keeps using LIKE.
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        run(SQLITE_REVERSE, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRES_REVERSE, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses_app', '0005_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseSearchEntry',
+            fields=[
+                ('expense', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='expenses_app.expenseincome')),
+                ('document', expenses_app.models.FullTextField(db_column='expense_search')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'expense_search',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_change_seq(apps, schema_editor):
+    model = apps.get_model('expenses_app', 'ExpenseIncome')
+    field = model._meta.get_field('change_seq')
+    if schema_editor.connection.vendor == 'sqlite':
+        # For a NOT NULL column the SQLite schema editor rebuilds the table,
+        # which drops the search triggers of migration 0006.
+        quote = schema_editor.quote_name
+        schema_editor.execute(
+            f'ALTER TABLE {quote(model._meta.db_table)} ADD COLUMN {quote(field.column)} bigint NOT NULL DEFAULT 0'
+        )
+    else:
+        schema_editor.add_field(model, field)
+
+
+def remove_change_seq(apps, schema_editor):
+    model = apps.get_model('expenses_app', 'ExpenseIncome')
+    schema_editor.remove_field(model, model._meta.get_field('change_seq'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('expenses_app', '0006_expense_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change_sequence', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExpenseTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='expenseincome',
+                    name='change_seq',
+                    field=models.BigIntegerField(default=0, editable=False),
+                ),
+            ],
+        ),
+        migrations.RunPython(add_change_seq, remove_change_seq),
+        migrations.AddIndex(
+            model_name='expenseincome',
+            index=models.Index(fields=['user', 'change_seq'], name='expense_user_change_seq_idx'),
+        ),
+        migrations.AddField(
+            model_name='expensetombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expense_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='expensetombstone',
+            index=models.Index(fields=['user', 'change_seq'], name='tombstone_user_change_seq_idx'),
+        ),
+    ]
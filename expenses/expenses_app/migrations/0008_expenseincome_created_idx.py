@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses_app', '0007_change_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expenseincome',
+            index=models.Index(fields=['created_at'], name='expense_created_idx'),
+        ),
+    ]
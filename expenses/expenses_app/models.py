@@ -1,10 +1,229 @@
-from django.db import models
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, Count, F, Lookup, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.db.models.lookups import Exact
+from django.utils import timezone
 
 # Create your models here.
 from django.contrib.auth.models import User
 
+from .caching import bump_data_versions
+
 # Create your models here.
 
+TOTAL_OUTPUT_FIELD = models.DecimalField(max_digits=20, decimal_places=6)
+
+
+def total_expression(amount='amount', tax='tax', tax_type='tax_type'):
+    """
+    SQL equivalent of `ExpenseIncome.total`, including its None handling.
+
+    The arguments are field names or expressions, so the same logic can be
+    evaluated over other tables or literal values.
+    """
+    if isinstance(amount, str):
+        amount = F(amount)
+    if isinstance(tax, str):
+        tax = F(tax)
+    if isinstance(tax_type, str):
+        tax_type = F(tax_type)
+    amount = Coalesce(amount, Value(Decimal('0')), output_field=TOTAL_OUTPUT_FIELD)
+    tax = Coalesce(tax, Value(Decimal('0')), output_field=TOTAL_OUTPUT_FIELD)
+    return Case(
+        When(Q(Exact(tax_type, 'flat')), then=amount + tax),
+        # `* 0.01` rather than `/ 100`: SQLite stores whole decimals as
+        # integers and would otherwise truncate the division.
+        When(Q(Exact(tax_type, 'percentage')), then=amount + amount * tax * Value(Decimal('0.01'))),
+        default=amount,
+        output_field=TOTAL_OUTPUT_FIELD,
+    )
+
+
+class LedgerEntry(namedtuple('LedgerEntry', 'user_id day transaction_type tax_type amount total')):
+    """What one ExpenseIncome row contributes to the derived aggregate tables."""
+
+    @property
+    def tax(self):
+        return self.total - self.amount
+
+
+def ledger_managers():
+    """Managers of the tables that ExpenseIncome writes keep up to date."""
+    return [UserBalance.objects, ExpenseRollup.objects]
+
+
+class ExpenseIncomeQuerySet(models.QuerySet):
+    _count_queryset = None
+
+    def count(self):
+        if self._count_queryset is not None:
+            return self._count_queryset.count()
+        return super().count()
+
+    def counted_as(self, queryset):
+        """
+        Return a copy whose count() is `queryset.count()`, for an ordering that
+        joins another table without changing which rows match. Chaining
+        anything but values() onto the copy drops this again.
+        """
+        clone = self._chain()
+        clone._count_queryset = queryset
+        return clone
+
+    def values(self, *fields, **expressions):
+        # Selecting other columns keeps the same rows, so the count still applies.
+        clone = super().values(*fields, **expressions)
+        clone._count_queryset = self._count_queryset
+        return clone
+
+    def with_total(self):
+        """
+        Make `total` usable in filter(), order_by() and aggregate().
+
+        It is added with alias() rather than annotate(): instances keep using
+        the `total` property, and the column is only computed where the query
+        actually references it.
+        """
+        return self.alias(total=total_expression())
+
+    def total_sum(self):
+        """SUM(total) over the queryset, computed in the database."""
+        # Django refuses to aggregate over an alias(), so use the expression.
+        return self.aggregate(total_sum=Sum(total_expression(), default=Decimal('0')))['total_sum']
+
+    def buckets(self, period):
+        """Per-period, per-transaction-type sums, grouped in the database."""
+        total = total_expression()
+        return self.order_by().annotate(
+            period=Trunc('created_at', period, output_field=models.DateField()),
+        ).values('period', 'transaction_type').annotate(
+            bucket_count=Count('id'),
+            bucket_amount=Sum('amount'),
+            bucket_tax=Sum(total - F('amount')),
+            bucket_total=Sum(total),
+        ).order_by('period', 'transaction_type')
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+            # We can't tell which rows were actually inserted; leave it to
+            # reconcile_balances/rebuild_rollups.
+            with transaction.atomic(using=self.db):
+                ChangeSequence.objects.stamp(objs)
+                objs = super().bulk_create(objs, *args, **kwargs)
+            bump_data_versions((obj.user_id for obj in objs), using=self.db)
+            return objs
+        with transaction.atomic(using=self.db):
+            ChangeSequence.objects.stamp(objs)
+            objs = super().bulk_create(objs, *args, **kwargs)
+            changes = [(None, obj.ledger_state()) for obj in objs]
+            for manager in ledger_managers():
+                manager.record_changes(changes)
+            bump_data_versions((obj.user_id for obj in objs), using=self.db)
+        for obj, (_, current) in zip(objs, changes):
+            obj._ledger_snapshot = current
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = [*fields, 'change_seq']
+        if not self.model.LEDGER_FIELDS & set(fields):
+            with transaction.atomic(using=self.db):
+                ChangeSequence.objects.stamp(objs)
+                rows = super().bulk_update(objs, fields, *args, **kwargs)
+            bump_data_versions((obj.user_id for obj in objs), using=self.db)
+            return rows
+        with transaction.atomic(using=self.db):
+            previous = self._stored_ledger_states(objs)
+            moved = defaultdict(list)
+            for obj in objs:
+                entry = previous.get(obj.pk)
+                if entry is not None and entry.user_id != obj.user_id:
+                    moved[entry.user_id].append(obj.pk)
+            seqs = ChangeSequence.objects.stamp(objs, extra_user_ids=moved)
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            ExpenseTombstone.objects.record(moved, seqs)
+            changes = [(previous.get(obj.pk), obj.ledger_state()) for obj in objs]
+            for manager in ledger_managers():
+                manager.record_changes(changes)
+            bump_data_versions(
+                {entry.user_id for change in changes for entry in change if entry is not None}, using=self.db,
+            )
+        for obj, (_, current) in zip(objs, changes):
+            obj._ledger_snapshot = current
+        return rows
+
+    def _stored_ledger_states(self, objs):
+        states = {}
+        missing = []
+        for obj in objs:
+            snapshot = getattr(obj, '_ledger_snapshot', None)
+            if snapshot is not None:
+                states[obj.pk] = snapshot
+            else:
+                missing.append(obj.pk)
+        if missing:
+            stored = self.model._base_manager.using(self.db).in_bulk(missing)
+            states.update((pk, obj.ledger_state()) for pk, obj in stored.items())
+        return states
+
+    def edit(self, batch_size=1000, **values):
+        """
+        Set `values` on every matching row like update(), but keep the
+        aggregate tables, the change feed and the response cache current.
+        Rows are changed in id order, `batch_size` at a time, each batch one
+        UPDATE in its own transaction. Returns the number of rows changed.
+        """
+        if {'user', 'user_id', 'change_seq'} & set(values):
+            raise TypeError("edit() can't move records between users or set change_seq.")
+        ledger = bool(self.model.LEDGER_FIELDS & set(values))
+        queryset = self.order_by('pk')
+        edited = last_pk = 0
+        while True:
+            # Keyset batches: rows already changed may no longer match the filter.
+            pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return edited
+            last_pk = pks[-1]
+            batch = self.model._default_manager.using(self.db).filter(pk__in=pks)
+            with transaction.atomic(using=self.db):
+                managers = ledger_managers() if ledger else []
+                before = [list(manager.totals_from(batch)) for manager in managers]
+                user_ids = set(batch.values_list('user_id', flat=True).distinct())
+                seqs = ChangeSequence.objects.advance(user_ids)
+                edited += batch.update(
+                    **values,
+                    change_seq=Case(*(When(user_id=user_id, then=Value(seq)) for user_id, seq in seqs.items())),
+                    updated_at=timezone.now(),
+                )
+                for manager, rows in zip(managers, before):
+                    manager.replace_totals(rows, list(manager.totals_from(batch)))
+                bump_data_versions(user_ids, using=self.db)
+
+    def delete(self):
+        # Bulk deletes (admin actions, cascades from other querysets) bypass
+        # ExpenseIncome.delete(), so subtract their totals here with one
+        # grouped query per aggregate table.
+        with transaction.atomic(using=self.db):
+            removed = [(manager, list(manager.totals_from(self))) for manager in ledger_managers()]
+            deleted = defaultdict(list)
+            for pk, user_id in self.order_by().values_list('pk', 'user_id'):
+                deleted[user_id].append(pk)
+            result = super().delete()
+            ExpenseTombstone.objects.record(deleted, ChangeSequence.objects.advance(deleted))
+            for manager, rows in removed:
+                manager.subtract(rows)
+            bump_data_versions({row['user_id'] for _, rows in removed for row in rows}, using=self.db)
+        return result
+
+
 class ExpenseIncome(models.Model):
     TRANSACTION_TYPE_CHOICES = [
         ('credit', 'Credit'),
@@ -24,18 +243,747 @@ class ExpenseIncome(models.Model):
     tax_type = models.CharField(max_length=10, choices=TAX_TYPE_CHOICES, default='flat')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # The owner's ChangeSequence value at the last write; the change feed's position.
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    objects = ExpenseIncomeQuerySet.as_manager()
+
+    # Fields that feed the aggregate tables; a save that touches none of them is free.
+    LEDGER_FIELDS = {'user', 'user_id', 'amount', 'tax', 'tax_type', 'transaction_type', 'created_at'}
+
+    class Meta:
+        # Every list query is scoped to one user, so each index leads with it.
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='expense_user_created_idx'),
+            models.Index(fields=['user', 'transaction_type', '-created_at'], name='expense_user_type_created_idx'),
+            models.Index(fields=['user', '-amount'], name='expense_user_amount_idx'),
+            models.Index(fields=['user', 'change_seq'], name='expense_user_change_seq_idx'),
+            # For the admin's date filters, which span all users.
+            models.Index(fields=['created_at'], name='expense_created_idx'),
+        ]
 
     @property
     def total(self):
+        return self.compute_total(self.amount, self.tax, self.tax_type)
+
+    @staticmethod
+    def compute_total(amount, tax, tax_type):
         # Handle None values for both amount and tax
-        amount_value = self.amount or 0
-        tax_value = self.tax or 0
+        amount_value = amount or Decimal('0')
+        tax_value = tax or Decimal('0')
         
-        if self.tax_type == 'flat':
+        if tax_type == 'flat':
             return amount_value + tax_value
-        elif self.tax_type == 'percentage':
+        elif tax_type == 'percentage':
             return amount_value + (amount_value * tax_value / 100)
         return amount_value
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what this row contributes to the aggregate tables so that
+        # save() can apply a delta without re-reading the old row.
+        if not cls.LEDGER_FIELDS & instance.get_deferred_fields():
+            instance._ledger_snapshot = instance.ledger_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._ledger_snapshot = None
+
+    def ledger_state(self):
+        # Unsaved instances may still hold ints or strings; sum Decimals only.
+        amount, tax = self.amount, self.tax
+        if not isinstance(amount, Decimal):
+            amount = self._meta.get_field('amount').to_python(amount) or Decimal('0')
+        if not isinstance(tax, Decimal):
+            tax = self._meta.get_field('tax').to_python(tax)
+        return LedgerEntry(
+            user_id=self.user_id,
+            day=timezone.localdate(self.created_at) if self.created_at else None,
+            transaction_type=self.transaction_type,
+            tax_type=self.tax_type,
+            amount=amount,
+            total=self.compute_total(amount, tax, self.tax_type),
+        )
+
+    def _stored_ledger_state(self):
+        snapshot = getattr(self, '_ledger_snapshot', None)
+        if snapshot is not None or self._state.adding:
+            return snapshot
+        stored = type(self)._base_manager.using(self._state.db).filter(pk=self.pk).first()
+        return stored.ledger_state() if stored is not None else None
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = [*update_fields, 'change_seq']
+        if update_fields is not None and not self.LEDGER_FIELDS & set(update_fields):
+            with transaction.atomic(using=kwargs.get('using')):
+                ChangeSequence.objects.stamp([self])
+                super().save(*args, **kwargs)
+            bump_data_versions([self.user_id], using=kwargs.get('using'))
+            return
+        previous = self._stored_ledger_state()
+        with transaction.atomic(using=kwargs.get('using')):
+            # Moving a record to another user is a delete for the old owner.
+            moved = {previous.user_id: [self.pk]} if previous and previous.user_id != self.user_id else {}
+            seqs = ChangeSequence.objects.stamp([self], extra_user_ids=moved)
+            super().save(*args, **kwargs)
+            ExpenseTombstone.objects.record(moved, seqs)
+            current = self.ledger_state()
+            for manager in ledger_managers():
+                manager.record_change(previous, current)
+            bump_data_versions(
+                {entry.user_id for entry in (previous, current) if entry is not None}, using=kwargs.get('using'),
+            )
+        self._ledger_snapshot = current
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = self._stored_ledger_state()
+            deleted = {self.user_id: [self.pk]}
+            result = super().delete(*args, **kwargs)
+            ExpenseTombstone.objects.record(deleted, ChangeSequence.objects.advance(deleted))
+            for manager in ledger_managers():
+                manager.record_change(previous, None)
+            bump_data_versions([self.user_id], using=kwargs.get('using'))
+        self._ledger_snapshot = None
+        return result
+
+    def __str__(self):
+        return f"{self.title} ({self.transaction_type}) - {self.amount}"
+
+
+
+class ChangeSequenceManager(models.Manager):
+    def advance(self, user_ids):
+        """
+        Take the next sequence value of each user, as {user_id: value}.
+
+        Must run in the transaction of the write being numbered: the counter
+        row stays locked until it commits, so each user's changes commit in
+        sequence order and a sync never skips one that commits late.
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return {}
+        values = self._increment(user_ids)
+        for user_id in user_ids:
+            if user_id in values:
+                continue
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(user_id=user_id, value=1)
+                values[user_id] = 1
+            except IntegrityError:
+                # Another writer created the counter first.
+                values.update(self._increment([user_id]))
+        return values
+
+    def _increment(self, user_ids):
+        connection = connections[self.db]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.filter(user_id__in=user_ids).update(value=F('value') + 1)
+            return dict(self.filter(user_id__in=user_ids).values_list('user_id', 'value'))
+        # One statement instead of an UPDATE and a SELECT.
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET value = value + 1 WHERE user_id IN ({placeholders}) RETURNING user_id, value',
+                user_ids,
+            )
+            return dict(cursor.fetchall())
+
+    def stamp(self, expenses, extra_user_ids=()):
+        """
+        Set `change_seq` on ExpenseIncome instances about to be written, one
+        value per owner. Returns the values taken, including those of
+        `extra_user_ids`.
+        """
+        seqs = self.advance([*(expense.user_id for expense in expenses), *extra_user_ids])
+        for expense in expenses:
+            expense.change_seq = seqs[expense.user_id]
+        return seqs
+
+
+class ChangeSequence(models.Model):
+    """
+    Per-user counter that numbers writes to the user's expenses for the
+    change feed. Every write in one transaction shares a value; the feed
+    breaks ties by id.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='change_sequence')
+    value = models.BigIntegerField(default=0)
+
+    objects = ChangeSequenceManager()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.value}"
+
+
+class ExpenseTombstoneManager(models.Manager):
+    def record(self, deleted, seqs):
+        """Store tombstones for {user_id: [expense ids]}, numbered by `seqs` from ChangeSequence.advance()."""
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, expense_id=expense_id, change_seq=seqs[user_id])
+                for user_id, expense_ids in deleted.items()
+                for expense_id in expense_ids
+            ],
+            batch_size=1000,
+        )
+
+
+class ExpenseTombstone(models.Model):
+    """
+    A deleted ExpenseIncome id, kept so the change feed can tell clients
+    to drop it. Written by ExpenseIncome.delete() and the queryset delete.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_tombstones')
+    expense_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ExpenseTombstoneManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'change_seq'], name='tombstone_user_change_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.expense_id} at {self.change_seq}"
+
+
+class ArchivedExpenseQuerySet(models.QuerySet):
+    def with_total(self):
+        """Like ExpenseIncomeQuerySet.with_total()."""
+        return self.alias(total=total_expression())
+
+    buckets = ExpenseIncomeQuerySet.buckets
+
+
+class ArchivedExpenseManager(models.Manager.from_queryset(ArchivedExpenseQuerySet)):
+    def horizon(self):
+        """Records created before this may be archived."""
+        return timezone.now() - timedelta(days=settings.EXPENSE_ARCHIVE_AFTER_DAYS)
+
+    def archive(self, before, batch_size=1000):
+        """
+        Move the ExpenseIncome rows created before `before` here, in id order,
+        `batch_size` rows per transaction. The aggregate tables and the
+        change feed already count them, so unlike QuerySet.delete() this
+        leaves them alone. Returns the number of rows moved.
+        """
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        old = ExpenseIncome.objects.using(self.db).filter(created_at__lt=before).order_by('pk')
+        moved = 0
+        while True:
+            with transaction.atomic(using=self.db):
+                rows = list(old.values(*fields)[:batch_size])
+                if not rows:
+                    return moved
+                self.bulk_create([self.model(**row) for row in rows])
+                # A plain DELETE: no tombstones, no ledger updates. The FTS
+                # triggers drop the rows from the search index.
+                old.filter(pk__in=[row['id'] for row in rows])._raw_delete(self.db)
+                bump_data_versions({row['user_id'] for row in rows}, using=self.db)
+            moved += len(rows)
+
+
+class ArchivedExpense(models.Model):
+    """
+    An ExpenseIncome row moved out of the hot table by
+    `manage.py archive_expenses`, with the same id and values. It keeps only
+    the indexes date-filtered lists and the change feed need, and is never
+    written again; expenses_app.archive reads it back.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_expenses')
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True, null=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_type = models.CharField(max_length=6, choices=ExpenseIncome.TRANSACTION_TYPE_CHOICES)
+    tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    tax_type = models.CharField(max_length=10, choices=ExpenseIncome.TAX_TYPE_CHOICES, default='flat')
+    # Copied as they were, so neither is auto_now.
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    change_seq = models.BigIntegerField(default=0)
+
+    objects = ArchivedExpenseManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archive_user_created_idx'),
+            models.Index(fields=['user', 'change_seq'], name='archive_user_change_seq_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.user_id}, archived)"
+
+
+class FullTextField(models.TextField):
+    """The hidden FTS5 column named after its table; filter on it with `match`."""
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class ExpenseSearchEntry(models.Model):
+    """
+    A row of the SQLite FTS5 index over ExpenseIncome title and description
+    (migration 0006). Triggers keep the index in sync with every write, bulk
+    and raw ones included; this model only exists so that searches can join
+    it and order by its bm25 `rank`.
+    """
+    expense = models.OneToOneField(
+        ExpenseIncome, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_entry',
+    )
+    document = FullTextField(db_column='expense_search')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'expense_search'
+
+
+class LedgerManager(models.Manager):
+    """
+    Manager for a table of running sums over ExpenseIncome. Rows are keyed by
+    `key_fields` and adjusted in place with F() deltas of `delta_fields`.
+    """
+    key_fields = ()
+    delta_fields = ()
+    touch_field = None
+
+    def entry_key(self, entry):
+        raise NotImplementedError
+
+    def entry_values(self, entry):
+        raise NotImplementedError
+
+    def totals_from(self, expenses):
+        """Grouped sums over an ExpenseIncome queryset, one dict per key."""
+        raise NotImplementedError
+
+    def record_change(self, previous, current):
+        """Apply the difference between two `LedgerEntry`s (either may be None)."""
+        self.record_changes([(previous, current)])
+
+    def record_changes(self, changes):
+        """
+        Apply many (previous, current) `LedgerEntry` pairs, with one UPDATE
+        per affected row rather than one per change.
+        """
+        deltas = {}
+        for previous, current in changes:
+            if previous == current:
+                continue
+            for entry, sign in ((previous, -1), (current, 1)):
+                if entry is None:
+                    continue
+                delta = deltas.setdefault(self.entry_key(entry), dict.fromkeys(self.delta_fields, 0))
+                for name, value in self.entry_values(entry).items():
+                    delta[name] += sign * value
+        for key, delta in deltas.items():
+            self.apply_delta(dict(zip(self.key_fields, key)), **delta)
+
+    def user_totals(self, user_ids):
+        """
+        totals_from() over everything the users ever recorded: their
+        ExpenseIncome rows and their archived ones, summed per key.
+        """
+        merged = {}
+        for model in (ExpenseIncome, ArchivedExpense):
+            for row in self.totals_from(model.objects.filter(user_id__in=user_ids)):
+                key = tuple(row[name] for name in self.key_fields)
+                if key in merged:
+                    for name in self.delta_fields:
+                        merged[key][name] += row[name] or 0
+                else:
+                    merged[key] = dict(row)
+        return list(merged.values())
+
+    def subtract(self, rows):
+        """Undo rows previously returned by `totals_from()`."""
+        self.replace_totals(rows, [])
+
+    def replace_totals(self, removed, added):
+        """
+        Swap `totals_from()` rows taken before a bulk change for those taken
+        after it, with one UPDATE per key whose sums changed.
+        """
+        deltas = {}
+        for rows, sign in ((removed, -1), (added, 1)):
+            for row in rows:
+                key = tuple(row[name] for name in self.key_fields)
+                delta = deltas.setdefault(key, dict.fromkeys(self.delta_fields, 0))
+                for name in self.delta_fields:
+                    delta[name] += sign * (row[name] or 0)
+        for key, delta in deltas.items():
+            self.apply_delta(dict(zip(self.key_fields, key)), **delta)
+
+    def apply_delta(self, key, **delta):
+        changes = {name: F(name) + value for name, value in delta.items() if value}
+        if not changes:
+            return
+        if self.touch_field:
+            changes[self.touch_field] = timezone.now()
+        if self.filter(**key).update(**changes):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(**key, **delta)
+        except IntegrityError:
+            # Another request created the row first (or the delta would make
+            # a new row negative, which only reconciliation can sort out).
+            self.filter(**key).update(**changes)
+
+
+class UserBalanceManager(LedgerManager):
+    key_fields = ('user_id',)
+    delta_fields = ('total_credit', 'total_debit', 'tax_paid', 'count')
+    touch_field = 'updated_at'
+
+    def entry_key(self, entry):
+        return (entry.user_id,)
+
+    def entry_values(self, entry):
+        credit = entry.transaction_type == 'credit'
+        return {
+            'total_credit': entry.total if credit else 0,
+            'total_debit': 0 if credit else entry.total,
+            'tax_paid': entry.tax,
+            'count': 1,
+        }
+
+    def totals_from(self, expenses):
+        total = total_expression()
+        return expenses.order_by().values('user_id').annotate(
+            total_credit=Sum(total, filter=Q(transaction_type='credit'), default=Decimal('0')),
+            total_debit=Sum(total, filter=~Q(transaction_type='credit'), default=Decimal('0')),
+            tax_paid=Sum(total - F('amount'), default=Decimal('0')),
+            count=Count('id'),
+        )
+
+    def for_user(self, user):
+        """Return the user's balance, computing it if it was never stored."""
+        try:
+            return self.get(user=user)
+        except self.model.DoesNotExist:
+            self.reconcile(user_ids=[user.pk])
+            return self.get(user=user)
+
+    async def afor_user(self, user):
+        try:
+            return await self.aget(user=user)
+        except self.model.DoesNotExist:
+            await sync_to_async(self.reconcile)(user_ids=[user.pk])
+            return await self.aget(user=user)
+
+    def reconcile(self, user_ids=None, batch_size=1000, dry_run=False):
+        """
+        Recompute balances from ExpenseIncome and ArchivedExpense in grouped
+        queries, one batch of users at a time, and fix the rows that drifted.
+        Returns the ids of the users whose stored balance was wrong or missing.
+        """
+        if user_ids is None:
+            user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        quantum = Decimal(1).scaleb(-self.model._meta.get_field('total_credit').decimal_places)
+        drifted = []
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                drifted += self._reconcile_batch(batch, quantum, dry_run)
+                batch = []
+        if batch:
+            drifted += self._reconcile_batch(batch, quantum, dry_run)
+        return drifted
+
+    def _reconcile_batch(self, user_ids, quantum, dry_run):
+        expected = {
+            row.pop('user_id'): row
+            for row in self.user_totals(user_ids)
+        }
+        stored = self.in_bulk(user_ids)
+        to_create, to_update = [], []
+        for user_id in user_ids:
+            values = expected.get(user_id, dict.fromkeys(self.delta_fields, 0))
+            values = {
+                name: value if name == 'count' else Decimal(value).quantize(quantum)
+                for name, value in values.items()
+            }
+            balance = stored.get(user_id)
+            if balance is None:
+                to_create.append(self.model(user_id=user_id, **values))
+            elif any(getattr(balance, name) != value for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(balance, name, value)
+                to_update.append(balance)
+        if not dry_run:
+            with transaction.atomic(using=self.db):
+                self.bulk_create(to_create)
+                self.bulk_update(to_update, self.delta_fields)
+        return [balance.user_id for balance in to_create + to_update]
+
+
+class UserBalance(models.Model):
+    """
+    Running per-user totals over ExpenseIncome, so the summary endpoint is a
+    single-row read. Kept current by ExpenseIncome.save()/delete() and the
+    ExpenseIncomeQuerySet bulk methods; `manage.py reconcile_balances` repairs
+    drift from writes that bypass them (QuerySet.update, raw SQL).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    total_credit = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    total_debit = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    tax_paid = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserBalanceManager()
+
+    @property
+    def net(self):
+        return (self.total_credit or 0) - (self.total_debit or 0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.net}"
+
+
+class ExpenseRollupQuerySet(models.QuerySet):
+    def buckets(self, period):
+        """Per-period, per-transaction-type sums over the daily rows."""
+        return self.filter(count__gt=0).annotate(
+            period=Trunc('day', period, output_field=models.DateField()),
+        ).values('period', 'transaction_type').annotate(
+            bucket_count=Sum('count'),
+            bucket_amount=Sum('amount'),
+            bucket_tax=Sum('tax'),
+            bucket_total=Sum('total'),
+        ).order_by('period', 'transaction_type')
+
+
+class ExpenseRollupManager(LedgerManager.from_queryset(ExpenseRollupQuerySet)):
+    key_fields = ('user_id', 'day', 'transaction_type', 'tax_type')
+    delta_fields = ('count', 'amount', 'tax', 'total')
+
+    def entry_key(self, entry):
+        return (entry.user_id, entry.day, entry.transaction_type, entry.tax_type)
+
+    def entry_values(self, entry):
+        return {'count': 1, 'amount': entry.amount, 'tax': entry.tax, 'total': entry.total}
+
+    def totals_from(self, expenses):
+        total = total_expression()
+        rows = expenses.order_by().annotate(day=TruncDate('created_at')).values(*self.key_fields).annotate(
+            rollup_count=Count('id'),
+            rollup_amount=Sum('amount'),
+            rollup_tax=Sum(total - F('amount')),
+            rollup_total=Sum(total),
+        )
+        # ExpenseIncome already has `amount`/`tax` columns, hence the prefix.
+        for row in rows:
+            yield {
+                **{name: row[name] for name in self.key_fields},
+                **{name: row[f'rollup_{name}'] for name in self.delta_fields},
+            }
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """Recreate the rollup rows of the given users (all users by default)."""
+        if user_ids is None:
+            user_ids = User.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        rebuilt = 0
+        batch = []
+        for user_id in user_ids:
+            batch.append(user_id)
+            if len(batch) == batch_size:
+                rebuilt += self._rebuild_batch(batch)
+                batch = []
+        if batch:
+            rebuilt += self._rebuild_batch(batch)
+        return rebuilt
+
+    def _rebuild_batch(self, user_ids):
+        rows = [self.model(**row) for row in self.user_totals(user_ids)]
+        with transaction.atomic(using=self.db):
+            self.filter(user_id__in=user_ids).delete()
+            self.bulk_create(rows, batch_size=1000)
+        return len(rows)
+
+
+class ExpenseRollup(models.Model):
+    """
+    Daily per-user sums by transaction and tax type. The analytics endpoint
+    groups these into days, weeks or months, so a year of history is a few
+    hundred rows however many transactions it holds. Maintained like
+    UserBalance; `manage.py rebuild_rollups` recomputes it.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expense_rollups')
+    day = models.DateField()
+    transaction_type = models.CharField(max_length=6, choices=ExpenseIncome.TRANSACTION_TYPE_CHOICES)
+    tax_type = models.CharField(max_length=10, choices=ExpenseIncome.TAX_TYPE_CHOICES)
+    count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    total = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+
+    objects = ExpenseRollupManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'transaction_type', 'tax_type'],
+                                    name='expense_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} {self.transaction_type}/{self.tax_type}: {self.total}"
+
+
+class QueueQuerySet(models.QuerySet):
+    """
+    A table of jobs worked by a management command. The model has PENDING
+    and RUNNING statuses, `started_at`, and an auto_now `updated_at` that
+    the worker saves with each unit of progress.
+    """
+    # Oldest first.
+    queue_order = ('pk',)
+
+    def claimable(self, stale_after):
+        # A running job that saved no progress for `stale_after` lost its worker.
+        model = self.model
+        return Q(status=model.PENDING) | Q(status=model.RUNNING, updated_at__lt=timezone.now() - stale_after)
+
+    def claim(self, stale_after=timedelta(minutes=5)):
+        """
+        Mark the oldest queued job running and return it, or None when the
+        queue is empty. The conditional UPDATE is the lock: if two workers
+        pick the same row, only one of them still matches it. Jobs left
+        running by a worker that died are claimed again, and resume from
+        their last saved progress.
+        """
+        running = self.model.RUNNING
+        while True:
+            job = self.filter(self.claimable(stale_after)).order_by(*self.queue_order).first()
+            if job is None:
+                return None
+            now = timezone.now()
+            # Matching updated_at as well keeps two workers from taking over the same stale job.
+            if self.filter(self.claimable(stale_after), pk=job.pk, updated_at=job.updated_at).update(
+                status=running, started_at=job.started_at or now, updated_at=now,
+            ):
+                job.status, job.started_at, job.updated_at = running, job.started_at or now, now
+                return job
+
+
+class ImportJobQuerySet(QueueQuerySet):
+    queue_order = ('created_at', 'pk')
+
+
+class ImportJob(models.Model):
+    """
+    A CSV upload waiting for, or being worked by, `manage.py process_imports`.
+    The counters are updated after every batch, so polling the job shows
+    progress while a large file is still being read. The upload is deleted
+    once the job is done or has failed.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='imports/%Y/%m/%d/')
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    detail = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Saved with every batch; see ImportJobQuerySet.claimable().
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ImportJobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='import_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
+
+
+class UserPurgeQuerySet(QueueQuerySet):
+    queue_order = ('requested_at', 'pk')
+
+
+class UserPurgeManager(models.Manager.from_queryset(UserPurgeQuerySet)):
+    def request(self, user):
+        """
+        Deactivate `user` right away and queue the deletion of the account
+        and its records for `manage.py process_purges`. Returns the purge;
+        asking again returns the same one, and requeues it if it failed.
+        """
+        with transaction.atomic(using=self.db):
+            user.is_active = False
+            # Also drops the user from the authentication cache.
+            user.save(update_fields=['is_active'])
+            purge, created = self.get_or_create(user_id=user.pk, defaults={'username': user.username})
+            if not created and purge.status == UserPurge.FAILED:
+                purge.status, purge.detail = UserPurge.PENDING, ''
+                purge.save(update_fields=['status', 'detail', 'updated_at'])
+        return purge
+
+
+class UserPurge(models.Model):
+    """
+    A deactivated account whose records `manage.py process_purges` is
+    deleting in batches. It refers to the user by id only, so it survives
+    the account and keeps the outcome.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user_id = models.BigIntegerField(unique=True)
+    username = models.CharField(max_length=150)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    detail = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Saved with every batch; see UserPurgeQuerySet.claim().
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserPurgeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'requested_at'], name='user_purge_status_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.title} ({self.transaction_type}) - {self.amount}"
\ No newline at end of file
+        return f"Purge of {self.username} ({self.status})"
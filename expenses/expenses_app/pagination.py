@@ -0,0 +1,65 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ExpenseIncomeCursorPagination(CursorPagination):
+    # Keyset pagination: each page is a `created_at < <position>` range scan on
+    # the (user, -created_at) index, so page 5000 costs the same as page 1.
+    ordering = '-created_at'
+
+
+class ExpenseIncomePagination(PageNumberPagination):
+    """
+    Page-number pagination by default, cursor pagination on request.
+
+    Clients opt in with `?pagination=cursor`; the `next`/`previous` links keep
+    the parameter so following them stays in cursor mode.
+    """
+    mode_query_param = 'pagination'
+    cursor_pagination_class = ExpenseIncomeCursorPagination
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, counting and fetching with the async ORM."""
+        if self.use_cursor(request):
+            return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Fill in the cached `count` so the paginator never runs it synchronously.
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.page.object_list = [item async for item in self.page.object_list]
+        return list(self.page)
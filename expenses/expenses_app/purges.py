@@ -0,0 +1,67 @@
+"""
+Background deletion of user accounts.
+
+Deleting a User cascades to every row that refers to it in one transaction,
+which on a large account holds the database's write locks for as long as
+the DELETE runs, and the admin's confirmation page loads every related
+object to list it. Instead, UserPurge.objects.request() deactivates the
+account at once, and `manage.py process_purges` deletes its rows with raw
+`DELETE ... WHERE id IN (...)` statements, one batch per transaction. Memory
+and lock time are bounded by the batch size, not the account. Progress
+commits with each batch, so a purge interrupted at any point resumes with
+the rows that are left. The User itself goes last, once nothing large
+refers to it, after the files of its import jobs: the cascade deletes the
+jobs' rows but would leave their uploads behind.
+"""
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+
+from .caching import bump_data_versions
+from .models import ArchivedExpense, ExpenseIncome, ExpenseRollup, ExpenseTombstone, ImportJob, UserPurge
+
+BATCH_SIZE = 1000
+
+# Tables that can hold many rows per user, emptied batch by batch before the
+# User is deleted. The cascade takes care of the rest.
+PURGED_MODELS = [ExpenseIncome, ArchivedExpense, ExpenseTombstone, ExpenseRollup]
+
+
+def run_purge(purge, batch_size=BATCH_SIZE):
+    """Delete a claimed purge's user and their records, and record the outcome."""
+    try:
+        for model in PURGED_MODELS:
+            delete_rows(purge, model, batch_size)
+        delete_uploads(purge)
+        User.objects.filter(pk=purge.user_id).delete()
+    except DatabaseError as exc:
+        purge.status, purge.detail = UserPurge.FAILED, str(exc)
+    else:
+        purge.status = UserPurge.DONE
+    purge.finished_at = timezone.now()
+    purge.save(update_fields=['status', 'detail', 'finished_at', 'updated_at'])
+    return purge
+
+
+def delete_rows(purge, model, batch_size):
+    using = router.db_for_write(model)
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    ids = model._base_manager.using(using).filter(user_id=purge.user_id).order_by('pk').values_list('pk', flat=True)
+    while True:
+        # The ids, the DELETE and the progress counter commit together.
+        with transaction.atomic(using=using):
+            batch = list(ids[:batch_size])
+            if not batch:
+                return
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(batch))})", batch)
+                purge.rows_deleted += cursor.rowcount
+            purge.save(update_fields=['rows_deleted', 'updated_at'])
+            bump_data_versions([purge.user_id], using=using)
+
+
+def delete_uploads(purge):
+    for job in ImportJob.objects.filter(user_id=purge.user_id).exclude(file=''):
+        job.file.delete()
@@ -0,0 +1,71 @@
+from django.http import Http404
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The compact output matches JSONRenderer's byte for byte: values orjson
+    has no native form for (Decimal, lazy strings) and dates, which DRF
+    formats differently, go through the same JSONEncoder.default(). The one
+    exception is floats written with an exponent (`1e16` rather than
+    `1e+16`), which no decimal field here produces. Indented or ASCII-only
+    output, and anything orjson refuses, use the stdlib encoder.
+    """
+    orjson_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.orjson_options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same \u2028/\u2029 escaping as JSONRenderer.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Selects a format for the export action, which streams its own body.
+    Its errors are rendered as JSON (see ExpenseIncomeViewSet.handle_exception),
+    so nothing is ever rendered here.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        raise NotImplementedError(f'{self.format} exports stream their own body')
+
+
+class CSVRenderer(ExportRenderer):
+    """`?format=csv` or `Accept: text/csv`."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class NDJSONRenderer(ExportRenderer):
+    """`?format=ndjson` or `Accept: application/x-ndjson`."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """A `?format=` that no renderer offers is a 406, like an unmet Accept, rather than a 404."""
+
+    def filter_renderers(self, renderers, format):
+        try:
+            return super().filter_renderers(renderers, format)
+        except Http404:
+            raise NotAcceptable(available_renderers=renderers)
@@ -0,0 +1,183 @@
+"""
+Full-text search for ExpenseIncome, a drop-in replacement for SearchFilter.
+
+SearchFilter turns `?search=` into `icontains` on every search field, which
+scans all of the user's rows. ExpenseSearchFilter sends it to a full-text
+index instead, picked by database vendor:
+
+- SQLite: the FTS5 table behind ExpenseSearchEntry (migration 0006), ranked by bm25
+- PostgreSQL: a GIN index over to_tsvector(title || description), ranked by ts_rank
+
+Other databases, and SQLite builds without FTS5, keep SearchFilter's LIKE.
+
+On SQLite the index is kept current by triggers on the expense table, and
+any migration that makes SQLite rebuild that table drops them. After every
+`migrate`, restore_search_triggers() recreates missing triggers and rebuilds
+the index from the table.
+Each search word must match the start of a word in the title or description,
+and every word has to match, as with SearchFilter. Unless `?ordering=` is
+given, the best matches come first.
+"""
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.db.models import BooleanField, F, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import ExpenseIncome, ExpenseSearchEntry
+
+WORD_RE = re.compile(r'\w+')
+
+EXPENSE_TABLE = ExpenseIncome._meta.db_table
+
+# As created by migration 0006.
+SQLITE_TRIGGERS = {
+    'expense_search_insert': f"""CREATE TRIGGER IF NOT EXISTS expense_search_insert AFTER INSERT ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END""",
+    'expense_search_delete': f"""CREATE TRIGGER IF NOT EXISTS expense_search_delete AFTER DELETE ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(expense_search, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+    END""",
+    'expense_search_update': f"""CREATE TRIGGER IF NOT EXISTS expense_search_update
+    AFTER UPDATE OF title, description, user_id ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO expense_search(expense_search, rowid, title, description, user_id)
+        VALUES ('delete', old.id, old.title, old.description, old.user_id);
+        INSERT INTO expense_search(rowid, title, description, user_id)
+        VALUES (new.id, new.title, new.description, new.user_id);
+    END""",
+}
+
+
+class SQLiteSearchBackend:
+    def __init__(self):
+        self.available = {}
+
+    def is_available(self, connection):
+        if connection.alias not in self.available:
+            self.available[connection.alias] = 'expense_search' in connection.introspection.table_names()
+        return self.available[connection.alias]
+
+    def search(self, queryset, words, user_id=None, ordering=None):
+        match = '{title description}: ' + ' '.join(f'"{word}"*' for word in words)
+        if user_id is not None:
+            # Intersect with the user's postings inside the index, rather
+            # than fetching every user's matches and filtering afterwards.
+            match = f'user_id: {int(user_id)} AND {match}'
+        # `id IN (SELECT rowid ... MATCH)` runs the full-text query once,
+        # whatever plan SQLite picks for the rest of the query.
+        hits = ExpenseSearchEntry.objects.filter(document__match=match).values('pk')
+        matched = queryset.filter(pk__in=hits)
+        if ordering is None:
+            return matched
+        # The rank is only available by joining the index. Ordered by rank,
+        # SQLite reads the index first; the count doesn't need the join, and
+        # through it SQLite may probe the index once per row instead.
+        ranked = matched.filter(search_entry__document__match=match).annotate(
+            search_rank=F('search_entry__rank'),
+        )
+        return ranked.order_by('search_rank', *ordering).counted_as(matched)
+
+    def restore_triggers(self, connection):
+        """
+        Recreate the triggers a table rebuild dropped, and rebuild the index,
+        which missed the writes made without them. Returns the names restored.
+        """
+        if 'expense_search' not in connection.introspection.table_names():
+            return set()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [EXPENSE_TABLE]
+            )
+            missing = set(SQLITE_TRIGGERS) - {row[0] for row in cursor.fetchall()}
+            for name in sorted(missing):
+                cursor.execute(SQLITE_TRIGGERS[name])
+            if missing:
+                cursor.execute("INSERT INTO expense_search(expense_search) VALUES ('rebuild')")
+        return missing
+
+
+class PostgreSQLSearchBackend:
+    # Must stay identical to the expression indexed in migration 0006.
+    document = "to_tsvector('simple', coalesce({table}.title, '') || ' ' || coalesce({table}.description, ''))"
+
+    def is_available(self, connection):
+        return True
+
+    def search(self, queryset, words, user_id=None, ordering=None):
+        table = connections[queryset.db].ops.quote_name(ExpenseIncome._meta.db_table)
+        document = self.document.format(table=table)
+        query = ' & '.join(f'{word}:*' for word in words)
+        tsquery = "to_tsquery('simple', %s)"
+        matched = queryset.filter(RawSQL(f'{document} @@ {tsquery}', [query], output_field=BooleanField()))
+        if ordering is None:
+            return matched
+        # Lower is better, as with bm25.
+        return matched.annotate(
+            search_rank=RawSQL(f'-ts_rank({document}, {tsquery})', [query], output_field=FloatField()),
+        ).order_by('search_rank', *ordering)
+
+
+# Keyed by connection.vendor; register another backend here to support more
+# databases. A backend has is_available(connection) and
+# search(queryset, words, user_id, ordering), where `ordering` is None to keep
+# the queryset's order, or the tie-breakers to order by after relevance.
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgreSQLSearchBackend(),
+}
+
+
+def get_search_backend(alias):
+    connection = connections[alias]
+    backend = SEARCH_BACKENDS.get(connection.vendor)
+    if backend is not None and backend.is_available(connection):
+        return backend
+    return None
+
+
+# Aliases whose backend has been probed, so get_search_backend() no longer
+# touches the database for them.
+_probed_aliases = set()
+
+
+async def aprobe_search_backends():
+    """Do get_search_backend()'s one-time database probe outside the event loop."""
+    for alias in connections:
+        if alias not in _probed_aliases:
+            await sync_to_async(get_search_backend)(alias)
+            _probed_aliases.add(alias)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, app_config, using, **kwargs):
+    connection = connections[using]
+    if app_config.name != 'expenses_app' or connection.vendor != 'sqlite':
+        return
+    if router.allow_migrate_model(using, ExpenseIncome):
+        SEARCH_BACKENDS['sqlite'].restore_triggers(connection)
+
+
+class ExpenseSearchFilter(filters.SearchFilter):
+    """
+    Must run after OrderingFilter: for the view's `ranked_search_actions`,
+    without `?ordering=`, it replaces the default ordering with relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        words = [word for term in self.get_search_terms(request) for word in WORD_RE.findall(term)]
+        backend = get_search_backend(queryset.db) if words else None
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        user_id = None if request.user.is_superuser else request.user.pk
+        ordering = None
+        ranked = getattr(view, 'action', None) in getattr(view, 'ranked_search_actions', ())
+        if ranked and not request.query_params.get(api_settings.ORDERING_PARAM):
+            ordering = getattr(view, 'ordering', None) or ()
+        return backend.search(queryset, words, user_id, ordering)
@@ -1,6 +1,14 @@
+from operator import itemgetter
+
 from django.contrib.auth.models import User
-from rest_framework import serializers
-from .models import ExpenseIncome
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .metrics import TimedSerializerMixin
+from .models import ExpenseIncome, ImportJob, UserBalance, UserPurge
+from .sync import decode_token
 
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -10,19 +18,99 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         fields = ['username', 'password']
 
     def create(self, validated_data):
-        if User.objects.filter(username=validated_data['username']).exists():
-            raise serializers.ValidationError({'username': 'A user with that username already exists.'})
+        # The username's UniqueValidator has already rejected duplicates.
         user = User.objects.create_user(
             username=validated_data['username'],
             password=validated_data['password']
         )
         return user
 
-class ExpenseIncomeSerializer(serializers.ModelSerializer):
+def is_record_id(value):
+    # bool is an int subclass, but JSON `true` is not record 1.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ExpenseIncomeListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    """
+    List mode of ExpenseIncomeSerializer, used by the bulk endpoint.
+
+    Items are validated independently: invalid ones are reported in
+    `item_errors` (aligned with the input) and skipped, and the valid ones are
+    written with bulk_create/bulk_update, one transaction per chunk. For
+    updates `instance` is a dict of the editable rows keyed by id.
+    """
+    chunk_size = 1000
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        if self.max_length is not None and len(data) > self.max_length:
+            return super().to_internal_value(data)
+        if not self.allow_empty and not data:
+            return super().to_internal_value(data)
+        self.item_errors = []
+        self.item_instances = []
+        self.valid_indices = []
+        seen_ids = set()
+        ret = []
+        for index, item in enumerate(data):
+            try:
+                if self.instance is not None:
+                    self.child.instance = self.get_item_instance(item, seen_ids)
+                validated = self.run_child_validation(item)
+            except serializers.ValidationError as exc:
+                self.item_errors.append(exc.detail)
+            else:
+                self.item_errors.append({})
+                self.item_instances.append(self.child.instance)
+                self.valid_indices.append(index)
+                ret.append(validated)
+        return ret
+
+    def get_item_instance(self, item, seen_ids):
+        pk = item.get('id') if isinstance(item, dict) else None
+        if pk in seen_ids:
+            raise serializers.ValidationError({'id': ['Duplicate id in this batch.']})
+        instance = self.instance.get(pk) if is_record_id(pk) else None
+        if instance is None:
+            raise serializers.ValidationError({'id': ['Not found.']})
+        seen_ids.add(pk)
+        return instance
+
+    def chunks(self, items):
+        for start in range(0, len(items), self.chunk_size):
+            yield items[start:start + self.chunk_size]
+
+    def create(self, validated_data):
+        ModelClass = self.child.Meta.model
+        objs = [ModelClass(**attrs) for attrs in validated_data]
+        for chunk in self.chunks(objs):
+            with transaction.atomic():
+                ModelClass.objects.bulk_create(chunk)
+        return objs
+
+    def update(self, instance, validated_data):
+        ModelClass = self.child.Meta.model
+        now = timezone.now()
+        objs = []
+        for obj, attrs in zip(self.item_instances, validated_data):
+            for name, value in attrs.items():
+                setattr(obj, name, value)
+            obj.updated_at = now
+            objs.append((obj, attrs))
+        for chunk in self.chunks(objs):
+            fields = {'updated_at'}.union(*(attrs.keys() for _, attrs in chunk))
+            with transaction.atomic():
+                ModelClass.objects.bulk_update([obj for obj, _ in chunk], sorted(fields))
+        return [obj for obj, _ in objs]
+
+
+class ExpenseIncomeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     total = serializers.SerializerMethodField()
 
     class Meta:
         model = ExpenseIncome
+        list_serializer_class = ExpenseIncomeListSerializer
         fields = [
             'id', 'title', 'description', 'amount', 'transaction_type', 'tax', 'tax_type',
             'total', 'created_at', 'updated_at'
@@ -30,6 +118,145 @@ class ExpenseIncomeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'total', 'created_at', 'updated_at']
 
     def get_total(self, obj):
-        return obj.total 
+        return obj.total
+
+
+class ExpenseIncomeRowSerializer(ExpenseIncomeSerializer):
+    """
+    ExpenseIncomeSerializer for `.values(*row_fields)` rows, used by `list`.
+
+    The output is identical, but each row is built from accessors prepared
+    once per serializer instead of walking every field's get_attribute() and
+    to_representation() per row. Model instances take the regular path.
+    """
+    row_fields = [name for name in ExpenseIncomeSerializer.Meta.fields if name != 'total']
+
+    # Fields whose to_representation() leaves database values unchanged.
+    passthrough_field_classes = (serializers.IntegerField, serializers.CharField, serializers.ChoiceField)
+
+    @cached_property
+    def row_accessors(self):
+        accessors = []
+        for name, field in self.fields.items():
+            if name == 'total':
+                accessor = self.row_total
+            elif type(field) in self.passthrough_field_classes:
+                accessor = itemgetter(name)
+            elif type(field) is serializers.DateTimeField:
+                accessor = self.row_converter(name, self.datetime_converter(field))
+            else:
+                accessor = self.row_converter(name, field.to_representation)
+            accessors.append((name, accessor))
+        return accessors
+
+    @staticmethod
+    def row_converter(name, convert):
+        def accessor(row):
+            value = row[name]
+            # Like Serializer.to_representation(), None skips the field.
+            return None if value is None else convert(value)
+        return accessor
+
+    @staticmethod
+    def datetime_converter(field):
+        """
+        DateTimeField.to_representation() with the output timezone looked up
+        once instead of per value, which is most of its cost.
+        """
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def convert(value):
+            if not timezone.is_aware(value):
+                return field.to_representation(value)
+            try:
+                value = value.astimezone(field_timezone).isoformat()
+            except OverflowError:
+                return field.to_representation(value)
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    @staticmethod
+    def row_total(row):
+        return ExpenseIncome.compute_total(row['amount'], row['tax'], row['tax_type'])
+
+    def to_representation(self, instance):
+        if not isinstance(instance, dict):
+            return super().to_representation(instance)
+        return {name: accessor(instance) for name, accessor in self.row_accessors}
+
+class UserBalanceSerializer(serializers.ModelSerializer):
+    net = serializers.DecimalField(max_digits=20, decimal_places=6, read_only=True)
+
+    class Meta:
+        model = UserBalance
+        fields = ['total_credit', 'total_debit', 'tax_paid', 'net', 'count']
+        read_only_fields = fields
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], default='month')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+
+class AnalyticsBucketSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    transaction_type = serializers.CharField()
+    count = serializers.IntegerField(source='bucket_count')
+    amount = serializers.DecimalField(max_digits=20, decimal_places=2, source='bucket_amount')
+    tax = serializers.DecimalField(max_digits=20, decimal_places=6, source='bucket_tax')
+    total = serializers.DecimalField(max_digits=20, decimal_places=6, source='bucket_total')
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    since = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=5000, default=1000)
+
+    def validate_since(self, value):
+        try:
+            return decode_token(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    file = serializers.FileField(write_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'file', 'status', 'rows_processed', 'rows_failed', 'errors', 'detail',
+            'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = [
+            'id', 'status', 'rows_processed', 'rows_failed', 'errors', 'detail',
+            'created_at', 'started_at', 'finished_at',
+        ]
+
+
+class UserPurgeSerializer(serializers.ModelSerializer):
+    # Superusers may purge any account; leaving it out purges the caller's own.
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False, write_only=True)
+
+    class Meta:
+        model = UserPurge
+        fields = [
+            'id', 'user', 'user_id', 'username', 'status', 'rows_deleted', 'detail',
+            'requested_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = [
+            'id', 'user_id', 'username', 'status', 'rows_deleted', 'detail',
+            'requested_at', 'started_at', 'finished_at',
+        ]
 
-   
\ No newline at end of file
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None and not request.user.is_superuser:
+            # Someone else's id fails like an id that doesn't exist, so the
+            # endpoint can't be used to find out which accounts exist.
+            fields['user'].queryset = User.objects.filter(pk=request.user.pk)
+        return fields
@@ -0,0 +1,76 @@
+"""
+Change feed for offline clients: what changed in a user's ledger since their
+last sync.
+
+Every write stamps the records it touches with the owner's next
+ChangeSequence value, and deletes leave an ExpenseTombstone with one.
+A position in the feed is a (change_seq, id) pair. Ids break ties between
+records written in the same transaction, so a page can end anywhere. Clients
+receive the position as an opaque token and send it back as `?since=`. Each
+page is a range scan of the (user, change_seq) indexes of ExpenseIncome,
+ArchivedExpense and ExpenseTombstone.
+
+Writes that bypass the model and queryset methods (QuerySet.update(), raw
+SQL) don't advance the sequence, as with the aggregate tables.
+"""
+import base64
+import binascii
+from operator import itemgetter
+
+from django.db.models import Q
+
+from .models import ArchivedExpense, ExpenseIncome, ExpenseTombstone
+
+START = (0, 0)
+
+
+def encode_token(position):
+    return base64.urlsafe_b64encode('{}.{}'.format(*position).encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """The position in a token from encode_token(); ValueError if it isn't one."""
+    try:
+        seq, pk = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode().split('.')
+        position = int(seq), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid sync token.')
+    if min(position) < 0:
+        raise ValueError('Invalid sync token.')
+    return position
+
+
+def after(position, seq_field, id_field):
+    seq, pk = position
+    # The change_seq__gte bound lets the database start the scan at `seq`.
+    return Q(**{f'{seq_field}__gte': seq}) & (Q(**{f'{seq_field}__gt': seq}) | Q(**{f'{id_field}__gt': pk}))
+
+
+def change_page(user, position, limit, fields):
+    """
+    Up to `limit` changes after `position`, oldest first: the `fields` of
+    created or updated records, the ids of deleted ones, the position of the
+    last change returned, and whether more follow.
+    """
+    changes = []
+    for model in (ExpenseIncome, ArchivedExpense):
+        rows = (
+            model.objects.filter(after(position, 'change_seq', 'id'), user=user)
+            .order_by('change_seq', 'id').values('change_seq', *fields)[:limit + 1]
+        )
+        changes += [((row['change_seq'], row['id']), row) for row in rows]
+    if position != START:
+        # A client syncing from scratch has nothing to delete.
+        tombstones = (
+            ExpenseTombstone.objects.filter(after(position, 'change_seq', 'expense_id'), user=user)
+            .order_by('change_seq', 'expense_id').values_list('change_seq', 'expense_id')[:limit + 1]
+        )
+        changes += [(tombstone, None) for tombstone in tombstones]
+    changes.sort(key=itemgetter(0))
+    page = changes[:limit]
+    return (
+        [row for _, row in page if row is not None],
+        [pk for (_, pk), row in page if row is None],
+        page[-1][0] if page else position,
+        len(changes) > limit,
+    )
@@ -1,10 +1,62 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import csv
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from io import StringIO
+from unittest import mock
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from django.db.models import Sum, Value
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from django.contrib.auth.models import User
-from .models import ExpenseIncome
+from .admin import EstimatedCountPaginator
+from .db_routers import DatabaseRoutingMiddleware, PrimaryReplicaRouter, read_from_replica
+from .caching import response_cache_stats
+from .metrics import request_metrics
+from .imports import flush
+from .purges import run_purge
+from .renderers import FastJSONRenderer
+from .search import restore_search_triggers
+from .throttling import UserCounterRateThrottle
+from .models import ArchivedExpense, ExpenseIncome, ExpenseRollup, ImportJob, UserBalance, UserPurge, total_expression
+from .serializers import ExpenseIncomeRowSerializer, ExpenseIncomeSerializer
+from .views import ExpenseIncomeViewSet
+import json
+from asgiref.sync import sync_to_async
 from rest_framework_simplejwt.tokens import RefreshToken
 
+
+class LedgerTestMixin:
+    """Token logins and bulk-created records, shared by the API test cases."""
+
+    def log_in(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    def create_expenses(self, user, count, **kwargs):
+        fields = {'amount': 10, 'transaction_type': 'debit', **kwargs}
+        return ExpenseIncome.objects.bulk_create([
+            ExpenseIncome(user=user, title=f'Expense {i}', **fields) for i in range(count)
+        ], batch_size=5000)
+
+
 class AuthTests(APITestCase):
     def test_user_registration(self):
         url = reverse('register')
@@ -133,6 +185,12 @@ class ExpenseIncomeTests(APITestCase):
         response = self.client.get(detail_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_missing_record(self):
+        self.auth(self.user_token)
+        for pk in (0, 'abc'):
+            response = self.client.get(reverse('expenseincome-detail', args=[pk]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_superuser_access(self):
         self.auth(self.user_token)
         url = reverse('expenseincome-list')
@@ -146,3 +204,1509 @@ class ExpenseIncomeTests(APITestCase):
         url = reverse('expenseincome-list')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cursor_pagination(self):
+        for i in range(15):
+            ExpenseIncome.objects.create(user=self.user, title=f'T{i}', amount=10, transaction_type='debit')
+        self.auth(self.user_token)
+        url = reverse('expenseincome-list')
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIn('pagination=cursor', response.data['next'])
+        second = self.client.get(response.data['next'])
+        titles = [r['title'] for r in response.data['results'] + second.data['results']]
+        self.assertEqual(titles, [f'T{i}' for i in reversed(range(15))])
+        self.assertIsNone(second.data['next'])
+
+    def test_cursor_pagination_ordered_by_total(self):
+        for i in range(15):
+            ExpenseIncome.objects.create(user=self.user, title=f'T{i}', amount=20 - i, transaction_type='debit')
+        self.auth(self.user_token)
+        url = reverse('expenseincome-list')
+        response = self.client.get(url, {'pagination': 'cursor', 'ordering': '-total'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second = self.client.get(response.data['next'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        titles = [r['title'] for r in response.data['results'] + second.data['results']]
+        self.assertEqual(titles, [f'T{i}' for i in range(15)])
+
+    def test_page_number_pagination_is_default(self):
+        self.auth(self.user_token)
+        response = self.client.get(reverse('expenseincome-list'))
+        self.assertIn('count', response.data)
+
+
+class UserBalanceTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.log_in(self.user)
+
+    def create(self, **kwargs):
+        data = {'title': 'A', 'amount': 100, 'transaction_type': 'debit', 'tax': 0, 'tax_type': 'flat'}
+        data.update(kwargs)
+        return ExpenseIncome.objects.create(user=self.user, **data)
+
+    def balance(self):
+        return UserBalance.objects.get(user=self.user)
+
+    def test_balance_follows_create_update_delete(self):
+        expense = self.create(amount=100, tax=10, tax_type='percentage')
+        self.create(amount=500, transaction_type='credit')
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid, balance.count),
+                         (500, 110, 10, 2))
+
+        expense.amount = 200
+        expense.transaction_type = 'credit'
+        expense.save()
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid), (720, 0, 20))
+
+        expense.delete()
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid, balance.count),
+                         (500, 0, 0, 1))
+
+    def test_bulk_create_and_update_maintain_balance(self):
+        created = ExpenseIncome.objects.bulk_create([
+            ExpenseIncome(user=self.user, title='A', amount=10, transaction_type='debit'),
+            ExpenseIncome(user=self.user, title='B', amount=20, tax=50, tax_type='percentage',
+                          transaction_type='credit'),
+        ])
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid, balance.count),
+                         (30, 10, 10, 2))
+        created[0].amount = 15
+        ExpenseIncome.objects.bulk_update(created, ['amount'])
+        # Instances without a snapshot are read back before the update.
+        fresh = ExpenseIncome(pk=created[1].pk, user=self.user, title='B', amount=40, tax=50,
+                              tax_type='percentage', transaction_type='credit', created_at=created[1].created_at)
+        ExpenseIncome.objects.bulk_update([fresh], ['amount'])
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid), (60, 15, 20))
+
+    def test_queryset_delete_updates_balance(self):
+        self.create(amount=10)
+        self.create(amount=20)
+        self.create(amount=30, transaction_type='credit')
+        ExpenseIncome.objects.filter(transaction_type='debit').delete()
+        balance = self.balance()
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.count), (30, 0, 1))
+
+    def test_summary_endpoint(self):
+        url = reverse('expenseincome-list')
+        self.client.post(url, {'title': 'Pay', 'amount': 1000, 'transaction_type': 'credit', 'tax': 0, 'tax_type': 'flat'})
+        self.client.post(url, {'title': 'Rent', 'amount': 300, 'transaction_type': 'debit', 'tax': 5, 'tax_type': 'flat'})
+        response = self.client.get(reverse('expenseincome-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['total_credit']), 1000)
+        self.assertEqual(Decimal(response.data['total_debit']), 305)
+        self.assertEqual(Decimal(response.data['tax_paid']), 5)
+        self.assertEqual(Decimal(response.data['net']), 695)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_summary_for_user_without_expenses(self):
+        response = self.client.get(reverse('expenseincome-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(Decimal(response.data['net']), 0)
+
+    def test_superuser_summary_covers_all_users(self):
+        self.create(amount=10, transaction_type='credit')
+        admin = User.objects.create_superuser(username='umesh', password=None)
+        ExpenseIncome.objects.create(user=admin, title='B', amount=5, transaction_type='credit')
+        self.log_in(admin)
+        response = self.client.get(reverse('expenseincome-summary'))
+        self.assertEqual(Decimal(response.data['total_credit']), 15)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_reconcile_repairs_drift(self):
+        self.create(amount=10)
+        self.create(amount=20)
+        # QuerySet.update() bypasses save(), so the stored balance falls behind.
+        ExpenseIncome.objects.filter(amount=20).update(amount=50)
+        self.assertEqual(self.balance().total_debit, 30)
+        out = StringIO()
+        call_command('reconcile_balances', '--dry-run', stdout=out)
+        self.assertIn('Found 1', out.getvalue())
+        self.assertEqual(self.balance().total_debit, 30)
+        call_command('reconcile_balances', stdout=out)
+        balance = self.balance()
+        self.assertEqual((balance.total_debit, balance.count), (60, 2))
+        call_command('reconcile_balances', stdout=out)
+        self.assertIn('Repaired 0', out.getvalue())
+
+
+class TotalExpressionTests(LedgerTestMixin, APITestCase):
+    AMOUNTS = [Decimal('0'), Decimal('0.01'), Decimal('5'), Decimal('33.33'), Decimal('99999999.99')]
+    TAXES = [Decimal('0'), Decimal('3'), Decimal('7.5'), Decimal('99.99')]
+    TAX_TYPES = ['flat', 'percentage', '']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='arun')
+        ExpenseIncome.objects.bulk_create([
+            ExpenseIncome(user=cls.user, title='T', amount=amount, tax=tax, tax_type=tax_type,
+                          transaction_type='debit')
+            for amount in cls.AMOUNTS for tax in cls.TAXES for tax_type in cls.TAX_TYPES
+        ])
+
+    def test_expression_matches_property(self):
+        rows = ExpenseIncome.objects.annotate(db_total=total_expression())
+        self.assertEqual(len(rows), 60)
+        for row in rows:
+            self.assertEqual(row.db_total, row.total, (row.amount, row.tax, row.tax_type))
+
+    def test_none_handling_matches_property(self):
+        for amount in (None, Decimal('12.50')):
+            for tax in (None, Decimal('4')):
+                for tax_type in ('flat', 'percentage', ''):
+                    expected = ExpenseIncome(amount=amount, tax=tax, tax_type=tax_type).total
+                    expression = total_expression(Value(amount), Value(tax), Value(tax_type))
+                    db_total = ExpenseIncome.objects.annotate(t=expression).values_list('t', flat=True)[0]
+                    self.assertEqual(db_total, expected, (amount, tax, tax_type))
+
+    def test_order_filter_and_sum_in_database(self):
+        qs = ExpenseIncome.objects.with_total()
+        by_property = sorted(ExpenseIncome.objects.all(), key=lambda row: (row.total, row.pk))
+        self.assertEqual(
+            list(qs.order_by('total', 'pk').values_list('pk', flat=True)),
+            [row.pk for row in by_property],
+        )
+        self.assertEqual(
+            set(qs.filter(total__gte=100).values_list('pk', flat=True)),
+            {row.pk for row in by_property if row.total >= 100},
+        )
+        # SQLite sums decimals as doubles, so allow for the last digits.
+        self.assertAlmostEqual(qs.total_sum(), sum(row.total for row in by_property), delta=Decimal('0.0001'))
+
+    def test_api_orders_and_filters_by_total(self):
+        self.log_in(self.user)
+        url = reverse('expenseincome-list')
+        response = self.client.get(url, {'ordering': '-total', 'total__gte': 5, 'total__lte': 40})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = [Decimal(str(row['total'])) for row in response.data['results']]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+        self.assertTrue(all(5 <= total <= 40 for total in totals))
+        expected = sum(1 for row in ExpenseIncome.objects.all() if 5 <= row.total <= 40)
+        self.assertEqual(response.data['count'], expected)
+
+
+class AnalyticsTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-analytics')
+
+    def create(self, day, user=None, **kwargs):
+        data = {'title': 'A', 'amount': 100, 'transaction_type': 'debit', 'tax': 0, 'tax_type': 'flat'}
+        data.update(kwargs)
+        expense = ExpenseIncome.objects.create(user=user or self.user, **data)
+        expense.created_at = datetime(*day, 12, tzinfo=dt_timezone.utc)
+        expense.save()
+        return expense
+
+    def test_rollup_follows_writes(self):
+        expense = self.create((2025, 1, 5), amount=100, tax=10)
+        self.create((2025, 1, 5), amount=50)
+        rollup = ExpenseRollup.objects.get(user=self.user, day=date(2025, 1, 5))
+        self.assertEqual((rollup.count, rollup.amount, rollup.tax, rollup.total), (2, 150, 10, 160))
+        expense.transaction_type = 'credit'
+        expense.save()
+        rollup = ExpenseRollup.objects.get(user=self.user, day=date(2025, 1, 5), transaction_type='debit')
+        self.assertEqual((rollup.count, rollup.total), (1, 50))
+        expense.delete()
+        self.assertEqual(ExpenseRollup.objects.get(transaction_type='credit').count, 0)
+
+    def test_monthly_buckets(self):
+        self.create((2025, 1, 5), amount=100, tax=10)
+        self.create((2025, 1, 20), amount=50, tax=10, tax_type='percentage')
+        self.create((2025, 1, 21), amount=500, transaction_type='credit')
+        self.create((2025, 2, 1), amount=30)
+        self.create((2025, 1, 5), user=self.other, amount=999)
+        response = self.client.get(self.url, {'period': 'month'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [(r['period'], r['transaction_type'], r['count'], Decimal(r['total'])) for r in response.data]
+        self.assertEqual(rows, [
+            ('2025-01-01', 'credit', 1, 500),
+            ('2025-01-01', 'debit', 2, 165),
+            ('2025-02-01', 'debit', 1, 30),
+        ])
+
+    def test_filters_and_date_range(self):
+        self.create((2025, 1, 5), amount=100)
+        self.create((2025, 1, 6), amount=500, transaction_type='credit')
+        self.create((2025, 1, 12), amount=30)
+        response = self.client.get(self.url, {'period': 'day', 'transaction_type': 'debit',
+                                              'start': '2025-01-01', 'end': '2025-01-10'})
+        self.assertEqual([(r['period'], r['count']) for r in response.data], [('2025-01-05', 1)])
+        response = self.client.get(self.url, {'transaction_type': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_falls_back_to_ledger(self):
+        self.create((2025, 1, 5), title='Coffee', amount=4)
+        self.create((2025, 1, 6), title='Rent', amount=800)
+        self.create((2025, 1, 13), title='Coffee', amount=5, tax=20, tax_type='percentage')
+        response = self.client.get(self.url, {'period': 'week', 'search': 'coffee'})
+        self.assertEqual(
+            [(r['period'], r['count'], Decimal(r['total'])) for r in response.data],
+            [('2024-12-30', 1, 4), ('2025-01-13', 1, 6)],
+        )
+
+    def test_rollup_and_ledger_paths_agree(self):
+        for i in range(20):
+            self.create((2025, 1 + i % 3, 1 + i), amount=10 + i, tax=i % 5,
+                        tax_type='percentage' if i % 2 else 'flat',
+                        transaction_type='credit' if i % 3 == 0 else 'debit')
+        from_rollups = self.client.get(self.url, {'period': 'week'}).data
+        # Any search term matches every row here but forces the ledger path.
+        from_ledger = self.client.get(self.url, {'period': 'week', 'search': 'A'}).data
+        self.assertEqual(from_rollups, from_ledger)
+
+    def test_rebuild_rollups(self):
+        self.create((2025, 1, 5), amount=100)
+        ExpenseRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('Rebuilt 1', out.getvalue())
+        response = self.client.get(self.url, {'period': 'day'})
+        self.assertEqual([(r['period'], r['count']) for r in response.data], [('2025-01-05', 1)])
+
+
+class BulkTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-bulk')
+
+    def item(self, **kwargs):
+        data = {'title': 'A', 'amount': '10.00', 'transaction_type': 'debit', 'tax': '0', 'tax_type': 'flat'}
+        data.update(kwargs)
+        return data
+
+    def test_bulk_create(self):
+        items = [self.item(title=f'T{i}', amount=i + 1) for i in range(25)]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (25, 0))
+        self.assertEqual(ExpenseIncome.objects.filter(user=self.user).count(), 25)
+        self.assertEqual(UserBalance.objects.get(user=self.user).total_debit, sum(range(1, 26)))
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(
+            list(ExpenseIncome.objects.filter(pk__in=ids).order_by('pk').values_list('title', flat=True)),
+            [f'T{i}' for i in range(25)],
+        )
+
+    def test_bulk_create_reports_item_errors(self):
+        items = [self.item(), self.item(amount='abc'), self.item(transaction_type='other'), 'nope']
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data['results']
+        self.assertIn('id', results[0])
+        self.assertIn('amount', results[1]['errors'])
+        self.assertIn('transaction_type', results[2]['errors'])
+        self.assertIn('errors', results[3])
+        self.assertEqual(ExpenseIncome.objects.count(), 1)
+
+        response = self.client.post(self.url, [self.item(amount='')], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'title': 'not a list'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_empty_batches_are_rejected(self):
+        for method in (self.client.post, self.client.patch, self.client.delete):
+            response = method(self.url, [], format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data, {'non_field_errors': ['This list may not be empty.']})
+
+    def test_bulk_create_ndjson(self):
+        body = '\n'.join(json.dumps(self.item(title=f'T{i}')) for i in range(3)) + '\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(ExpenseIncome.objects.count(), 3)
+        response = self.client.post(self.url, '{"title": "A"}\n{broken', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update(self):
+        mine = ExpenseIncome.objects.create(user=self.user, title='A', amount=10, transaction_type='debit')
+        theirs = ExpenseIncome.objects.create(user=self.other, title='B', amount=10, transaction_type='debit')
+        items = [
+            {'id': mine.pk, 'amount': '30.00', 'tax': '10', 'tax_type': 'percentage'},
+            {'id': theirs.pk, 'amount': '99.00'},
+            {'amount': '1.00'},
+            {'id': mine.pk, 'title': 'again'},
+        ]
+        response = self.client.patch(self.url, items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data['results']
+        self.assertEqual(results[0], {'id': mine.pk})
+        self.assertIn('id', results[1]['errors'])
+        self.assertIn('id', results[2]['errors'])
+        self.assertIn('id', results[3]['errors'])
+        mine.refresh_from_db()
+        theirs.refresh_from_db()
+        self.assertEqual((mine.amount, mine.title, mine.total), (30, 'A', 33))
+        self.assertEqual(theirs.amount, 10)
+        balance = UserBalance.objects.get(user=self.user)
+        self.assertEqual((balance.total_debit, balance.tax_paid), (33, 3))
+
+    def test_bulk_delete(self):
+        mine = [ExpenseIncome.objects.create(user=self.user, title='A', amount=10, transaction_type='debit')
+                for _ in range(3)]
+        theirs = ExpenseIncome.objects.create(user=self.other, title='B', amount=10, transaction_type='debit')
+        response = self.client.delete(self.url, [mine[0].pk, {'id': mine[1].pk}, theirs.pk], format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['results'][2], {'errors': {'id': ['Not found.']}})
+        self.assertEqual(list(ExpenseIncome.objects.filter(user=self.user)), [mine[2]])
+        self.assertTrue(ExpenseIncome.objects.filter(pk=theirs.pk).exists())
+        self.assertEqual(UserBalance.objects.get(user=self.user).count, 1)
+
+    def test_booleans_are_not_ids(self):
+        ExpenseIncome.objects.create(pk=1, user=self.user, title='A', amount=10, transaction_type='debit')
+        response = self.client.patch(self.url, [{'id': True, 'amount': '30.00'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['results'], [{'errors': {'id': ['Not found.']}}])
+        response = self.client.delete(self.url, [True, {'id': True}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['results'], [{'errors': {'id': ['Not found.']}}] * 2)
+        self.assertEqual(ExpenseIncome.objects.get(pk=1).amount, 10)
+
+    def test_no_per_row_queries(self):
+        self.client.post(self.url, [self.item()], format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, [self.item(title=f'T{i}') for i in range(300)], format='json')
+        # A few multi-row INSERTs plus one UPDATE per aggregate row.
+        self.assertLess(len(queries), 15)
+
+
+class ExportTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-export')
+        for i, (title, amount) in enumerate([('Rent', '1000.00'), ('Food', '50.00'), ('Salary', '3000.00')]):
+            ExpenseIncome.objects.create(
+                user=self.user, title=title, amount=amount, tax=10,
+                transaction_type='credit' if title == 'Salary' else 'debit',
+                tax_type='percentage' if i % 2 else 'flat',
+            )
+        ExpenseIncome.objects.create(user=other, title='Other', amount=1, transaction_type='debit')
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.client.get(self.url, {'ordering': 'amount'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(self.content(response))))
+        self.assertEqual([row['title'] for row in rows], ['Food', 'Rent', 'Salary'])
+        self.assertEqual(rows[0]['amount'], '50.00')
+        self.assertEqual(Decimal(rows[0]['total']), Decimal('55'))
+        self.assertEqual(Decimal(rows[1]['total']), Decimal('1010'))
+
+    def test_ndjson_export_matches_api_representation(self):
+        response = self.client.get(self.url, {'format': 'ndjson', 'transaction_type': 'debit', 'search': 'Rent'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        exported = json.loads(lines[0])
+        detail = self.client.get(reverse('expenseincome-detail', args=[exported['id']]))
+        self.assertEqual(exported, json.loads(detail.content))
+
+    def test_export_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_csv_total_matches_api_representation(self):
+        expense = ExpenseIncome.objects.create(
+            user=self.user, title='Tea', amount='10.50', tax=10, tax_type='percentage', transaction_type='debit',
+        )
+        rows = list(csv.DictReader(StringIO(self.content(self.client.get(self.url, {'search': 'tea'})))))
+        detail = self.client.get(reverse('expenseincome-detail', args=[expense.pk]))
+        self.assertEqual(rows[0]['total'], '11.55')
+        self.assertEqual(rows[0]['total'], str(json.loads(detail.content)['total']))
+
+    def test_other_formats_are_not_acceptable(self):
+        for params, headers in [({'format': 'json'}, {}), ({}, {'HTTP_ACCEPT': 'application/json'})]:
+            response = self.client.get(self.url, params, **headers)
+            self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('detail', response.json())
+
+    def test_errors_are_json(self):
+        for fmt in ('csv', 'ndjson'):
+            response = self.client.get(self.url, {'format': fmt, 'created_at__gte': 'notadate'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('created_at__gte', response.json())
+
+
+class ImportTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='arun')
+        self.log_in(self.user)
+        self.url = reverse('importjob-list')
+
+    def upload(self, content):
+        return self.client.post(self.url, {'file': SimpleUploadedFile('statement.csv', content.encode())})
+
+    def run_worker(self):
+        call_command('process_imports', '--once', '--batch-size', '2', stdout=StringIO())
+
+    def test_import_runs_in_background(self):
+        response = self.upload(
+            'title,amount,transaction_type,tax,tax_type\n'
+            'Rent,1000,debit,10,percentage\n'
+            'Broken,abc,debit,,\n'
+            'Salary,3000,credit,,\n'
+            'Food,50,debit,5,flat\n'
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], ImportJob.PENDING)
+        self.assertFalse(ExpenseIncome.objects.exists())
+
+        self.run_worker()
+        job = self.client.get(reverse('importjob-detail', args=[response.data['id']])).data
+        self.assertEqual(job['status'], ImportJob.DONE)
+        self.assertEqual((job['rows_processed'], job['rows_failed']), (4, 1))
+        self.assertEqual(job['errors'][0]['line'], 3)
+        self.assertIn('amount', job['errors'][0]['errors'])
+        self.assertEqual(
+            sorted(ExpenseIncome.objects.filter(user=self.user).values_list('title', flat=True)),
+            ['Food', 'Rent', 'Salary'],
+        )
+        self.assertEqual(UserBalance.objects.get(user=self.user).total_debit, Decimal('1155'))
+
+    def test_missing_columns_fail_the_job(self):
+        job_id = self.upload('title,amount\nRent,1000\n').data['id']
+        self.run_worker()
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIn('transaction_type', job.detail)
+
+    def test_claim_takes_each_job_once(self):
+        self.upload('title,amount,transaction_type\n')
+        self.assertEqual(ImportJob.objects.claim().status, ImportJob.RUNNING)
+        self.assertIsNone(ImportJob.objects.claim())
+
+    def test_stale_job_is_reclaimed_and_resumes(self):
+        job_id = self.upload('title,amount,transaction_type\nRent,1000,debit\nFood,50,debit\nTea,4,debit\n').data['id']
+        # A worker committed the first batch of two rows, then died.
+        job = ImportJob.objects.claim()
+        job.rows_processed = 2
+        flush(job, [ExpenseIncome(user=self.user, title=title, amount=1, transaction_type='debit')
+                    for title in ('Rent', 'Food')])
+        self.assertIsNone(ImportJob.objects.claim())
+        ImportJob.objects.filter(pk=job_id).update(updated_at=timezone.now() - timedelta(minutes=10))
+        self.run_worker()
+        job = ImportJob.objects.get(pk=job_id)
+        self.assertEqual((job.status, job.rows_processed), (ImportJob.DONE, 3))
+        self.assertEqual(
+            sorted(ExpenseIncome.objects.filter(user=self.user).values_list('title', flat=True)),
+            ['Food', 'Rent', 'Tea'],
+        )
+
+    def test_upload_is_deleted_when_the_job_finishes(self):
+        for content in ('title,amount,transaction_type\nRent,1000,debit\n', 'title,amount\nRent,1000\n'):
+            job = ImportJob.objects.get(pk=self.upload(content).data['id'])
+            path = job.file.path
+            self.assertTrue(os.path.exists(path))
+            self.run_worker()
+            job.refresh_from_db()
+            self.assertIn(job.status, [ImportJob.DONE, ImportJob.FAILED])
+            self.assertFalse(job.file)
+            self.assertFalse(os.path.exists(path))
+
+    def test_jobs_are_private(self):
+        job_id = self.upload('title,amount,transaction_type\n').data['id']
+        other = User.objects.create_user(username='bibek')
+        self.log_in(other)
+        response = self.client.get(reverse('importjob-detail', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecordingRouter(PrimaryReplicaRouter):
+    """Records where reads would be routed, then lets them fall through to default."""
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        self.reads.append(super().db_for_read(model, **hints))
+        return None
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_ROUTERS=['expenses_app.tests.RecordingRouter'])
+class DatabaseRoutingTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.expense = ExpenseIncome.objects.create(user=self.user, title='Rent', amount=10, transaction_type='debit')
+        self.log_in(self.user)
+        RecordingRouter.reads = []
+
+    def test_router_sticks_to_primary_after_a_write(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(ExpenseIncome))
+
+        def view(request):
+            read_from_replica()
+            before = router.db_for_read(ExpenseIncome)
+            router.db_for_write(ExpenseIncome)
+            return before, router.db_for_read(ExpenseIncome)
+
+        self.assertEqual(DatabaseRoutingMiddleware(view)(None), ('replica', None))
+        self.assertIsNone(router.db_for_read(ExpenseIncome))
+
+    def test_read_actions_use_replicas(self):
+        admin = User.objects.create_superuser(username='admin', password='pass')
+        self.log_in(admin)
+        for url in [reverse('expenseincome-list'), reverse('expenseincome-detail', args=[self.expense.pk])]:
+            RecordingRouter.reads = []
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertIn('replica', RecordingRouter.reads)
+
+    def test_cached_responses_are_read_from_primary(self):
+        # A lagging replica's rows would be cached under the current version.
+        for url in [reverse('expenseincome-list'), reverse('expenseincome-detail', args=[self.expense.pk])]:
+            RecordingRouter.reads = []
+            response = self.client.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertTrue(RecordingRouter.reads)
+            self.assertNotIn('replica', RecordingRouter.reads)
+        RecordingRouter.reads = []
+        self.assertEqual(self.client.get(reverse('expenseincome-summary')).status_code, status.HTTP_200_OK)
+        self.assertIn('replica', RecordingRouter.reads)
+
+    def test_writes_read_from_primary(self):
+        response = self.client.patch(
+            reverse('expenseincome-detail', args=[self.expense.pk]), {'title': 'Flat'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(RecordingRouter.reads)
+        self.assertNotIn('replica', RecordingRouter.reads)
+
+
+class CachedAuthenticationTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.expense = ExpenseIncome.objects.create(user=self.user, title='Rent', amount=10, transaction_type='debit')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-detail', args=[self.expense.pk])
+
+    def test_warm_requests_make_no_auth_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        caches['responses'].clear()
+        # Only the expense itself is read: no user lookup, no owner lookup.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_in_another_process_takes_effect(self):
+        self.client.get(self.url)
+        # Another process deactivates the user; its post_save drops the shared entry.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        subprocess.run(
+            [sys.executable, 'manage.py', 'shell', '-c',
+             'from django.contrib.auth.models import User; '
+             'from expenses_app.authentication import invalidate_cached_user; '
+             f'invalidate_cached_user(User, User(pk={self.user.pk}))'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'DB_NAME': ':memory:'}, check=True, capture_output=True,
+        )
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user_is_rejected(self):
+        self.client.get(self.url)
+        self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CounterThrottleTests(APITestCase):
+    class Throttle(UserCounterRateThrottle):
+        rate = '3/min'
+        now = 600.0
+
+        def timer(self):
+            return self.now
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.request = type('Request', (), {'user': User.objects.create_user(username='arun')})()
+
+    def hit(self, now):
+        self.Throttle.now = now
+        throttle = self.Throttle()
+        return throttle.allow_request(self.request, None), throttle
+
+    def test_limit_within_a_window(self):
+        self.assertEqual([self.hit(600 + i)[0] for i in range(4)], [True, True, True, False])
+        allowed, throttle = self.hit(630)
+        self.assertFalse(allowed)
+        self.assertEqual(throttle.wait(), 30)
+
+    def test_previous_window_is_weighted(self):
+        for i in range(3):
+            self.hit(600 + i)
+        # At 675s the sliding window still covers 3/4 of the previous one: 2.25 + 1 > 3.
+        self.assertFalse(self.hit(675)[0])
+        # At 700s it covers 1/3, which leaves room for two more.
+        self.assertEqual([self.hit(700)[0] for _ in range(3)], [True, True, False])
+
+    def test_rejected_requests_are_not_counted(self):
+        for i in range(10):
+            self.hit(600 + i)
+        self.assertTrue(self.hit(720)[0])
+
+
+class ResponseCacheTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.expense = ExpenseIncome.objects.create(user=self.user, title='Rent', amount=10, transaction_type='debit')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-list')
+
+    def test_repeated_list_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(self.client.get(self.url, {'ordering': 'amount'})['X-Cache'], 'MISS')
+
+    def test_writes_in_other_processes_invalidate(self):
+        first = self.client.get(self.url)
+        # What a worker such as process_imports does after writing this user's records.
+        subprocess.run(
+            [sys.executable, 'manage.py', 'shell', '-c',
+             f'from expenses_app.caching import bump_data_versions; bump_data_versions([{self.user.pk}])'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'DB_NAME': ':memory:'}, check=True, capture_output=True,
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_can_be_disabled(self):
+        for attempt in range(2):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('X-Cache', response)
+            self.assertNotIn('ETag', response)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_writes_invalidate(self):
+        detail_url = reverse('expenseincome-detail', args=[self.expense.pk])
+        list_etag = self.client.get(self.url)['ETag']
+        self.client.get(detail_url)
+        self.client.patch(detail_url, {'title': 'Flat'}, format='json')
+
+        detail = self.client.get(detail_url)
+        self.assertEqual((detail['X-Cache'], detail.data['title']), ('MISS', 'Flat'))
+        self.client.post(self.url, {'title': 'Food', 'amount': '5', 'transaction_type': 'debit'}, format='json')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_users_do_not_share_entries(self):
+        self.client.get(self.url)
+        other = User.objects.create_user(username='bibek')
+        self.log_in(other)
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], response.data['count']), ('MISS', 0))
+
+    def test_cache_stats(self):
+        before = response_cache_stats.snapshot()
+        self.client.get(self.url)
+        self.client.get(self.url)
+        after = response_cache_stats.snapshot()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(self.client.get(reverse('expenseincome-cache-stats')).status_code, status.HTTP_403_FORBIDDEN)
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.log_in(admin)
+        self.assertEqual(set(self.client.get(reverse('expenseincome-cache-stats')).data),
+                         {'hits', 'misses', 'not_modified'})
+
+
+class SearchTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-list')
+        self.create('Groceries', 'weekly coffee and bread', amount=30)
+        self.create('Coffee beans', 'for the office', amount=12)
+        self.create('Rent', None, amount=800)
+        ExpenseIncome.objects.create(user=other, title='Coffee', amount=3, transaction_type='debit')
+
+    def create(self, title, description, **kwargs):
+        return ExpenseIncome.objects.create(
+            user=self.user, title=title, description=description, transaction_type='debit', **kwargs
+        )
+
+    def search(self, term, **params):
+        response = self.client.get(self.url, {'search': term, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['title'] for row in response.data['results']]
+
+    def test_search_uses_full_text_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search('coffee')
+        self.assertTrue(any('MATCH' in query['sql'] for query in queries))
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+
+    def test_results_are_ranked(self):
+        # A title match outranks a description match; other users never show up.
+        self.assertEqual(self.search('coffee'), ['Coffee beans', 'Groceries'])
+        self.assertEqual(self.search('coffee', ordering='amount'), ['Coffee beans', 'Groceries'])
+        self.assertEqual(self.search('coffee', ordering='-amount'), ['Groceries', 'Coffee beans'])
+
+    def test_prefixes_and_all_words_must_match(self):
+        self.assertEqual(self.search('gro'), ['Groceries'])
+        self.assertEqual(self.search('coffee bread'), ['Groceries'])
+        self.assertEqual(self.search('coffee tea'), [])
+
+    def test_migrate_restores_dropped_triggers(self):
+        # As after a migration that rebuilds the expense table.
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER expense_search_insert')
+        self.create('Green tea', None, amount=4)
+        self.assertEqual(self.search('tea'), [])
+        restore_search_triggers(sender=None, app_config=django_apps.get_app_config('expenses_app'), using='default')
+        caches['responses'].clear()
+        self.assertEqual(self.search('tea'), ['Green tea'])
+        self.create('Tea cups', None, amount=9)
+        self.assertEqual(self.search('tea'), ['Tea cups', 'Green tea'])
+
+    def test_index_follows_writes(self):
+        rent = ExpenseIncome.objects.get(title='Rent')
+        rent.title = 'Flat rent'
+        rent.save()
+        self.assertEqual(self.search('flat'), ['Flat rent'])
+        ExpenseIncome.objects.filter(pk=rent.pk).update(description='paid to landlord')
+        self.assertEqual(self.search('landlord'), ['Flat rent'])
+        rent.delete()
+        self.assertEqual(self.search('flat'), [])
+
+
+class RowSerializerTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-list')
+        rows = [
+            ('Salary', 'monthly pay', Decimal('2500.00'), 'credit', Decimal('0'), 'flat'),
+            ('Coffee', None, Decimal('3.50'), 'debit', Decimal('7.5'), 'percentage'),
+            ('Rent', '', Decimal('1234.56'), 'debit', Decimal('12.34'), 'flat'),
+            ('Refund', 'coffee machine', Decimal('0.01'), 'credit', Decimal('33.33'), 'percentage'),
+        ]
+        for title, description, amount, transaction_type, tax, tax_type in rows:
+            ExpenseIncome.objects.create(
+                user=self.user, title=title, description=description, amount=amount,
+                transaction_type=transaction_type, tax=tax, tax_type=tax_type,
+            )
+        ExpenseIncome.objects.filter(title='Rent').update(
+            created_at=datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        )
+
+    def render(self, serializer_class, items):
+        return JSONRenderer().render(serializer_class(items, many=True).data)
+
+    def assert_same_output(self, queryset):
+        expected = self.render(ExpenseIncomeSerializer, list(queryset))
+        rows = queryset.values(*ExpenseIncomeRowSerializer.row_fields)
+        self.assertEqual(self.render(ExpenseIncomeRowSerializer, rows), expected)
+
+    def test_rows_serialize_like_instances(self):
+        self.assert_same_output(ExpenseIncome.objects.order_by('pk'))
+
+    def test_rows_serialize_like_instances_in_other_timezones(self):
+        with timezone.override('Asia/Kathmandu'):
+            self.assert_same_output(ExpenseIncome.objects.order_by('pk'))
+
+    def test_instances_take_the_regular_path(self):
+        instances = list(ExpenseIncome.objects.order_by('pk'))
+        self.assertEqual(
+            self.render(ExpenseIncomeRowSerializer, instances), self.render(ExpenseIncomeSerializer, instances)
+        )
+
+    def assert_list_matches(self, params, instances):
+        caches['responses'].clear()
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = self.render(ExpenseIncomeSerializer, list(instances))
+        self.assertEqual(json.loads(response.content)['results'], json.loads(expected))
+        # Byte-for-byte, not just equal after parsing.
+        self.assertIn(b'"results":' + expected, response.content)
+
+    def test_list_responses_match_the_model_serializer(self):
+        expenses = ExpenseIncome.objects.filter(user=self.user)
+        self.assert_list_matches({}, expenses.order_by('-created_at'))
+        self.assert_list_matches({'ordering': 'total'}, expenses.with_total().order_by('total'))
+        self.assert_list_matches({'pagination': 'cursor'}, expenses.order_by('-created_at'))
+        self.assert_list_matches(
+            {'pagination': 'cursor', 'ordering': 'total'}, expenses.with_total().order_by('total', 'pk'),
+        )
+        # Ranked: the title match comes before the description match.
+        self.assert_list_matches({'search': 'coffee'}, [expenses.get(title='Coffee'), expenses.get(title='Refund')])
+
+
+class FastJSONTests(LedgerTestMixin, APITestCase):
+    data = {
+        'amount': Decimal('12.50'),
+        'total': Decimal('13.4375'),
+        'created_at': datetime(2024, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'day': date(2024, 3, 1),
+        'title': 'Caf\u00e9 \u2028 line',
+        'nested': [{'id': 1, 'description': None}, {1: True}],
+        'detail': _('Not found.'),
+    }
+
+    def test_renders_like_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+        indented = FastJSONRenderer().render(self.data, 'application/json; indent=4')
+        self.assertEqual(indented, JSONRenderer().render(self.data, 'application/json; indent=4'))
+
+    def test_responses_are_gzipped_on_request(self):
+        user = User.objects.create_user(username='arun')
+        for i in range(20):
+            ExpenseIncome.objects.create(user=user, title=f'Expense {i}', amount=10, transaction_type='debit')
+        self.log_in(user)
+        url = reverse('expenseincome-list')
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        # The ETag is weakened by compression but still revalidates.
+        self.assertTrue(compressed['ETag'].startswith('W/'))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        request_metrics.clear()
+        caches['responses'].clear()
+        self.user = User.objects.create_user(username='arun', password='pass@@@1234567')
+        ExpenseIncome.objects.create(user=self.user, title='Coffee', amount=3, transaction_type='debit')
+        self.log_in(self.user)
+
+    def scrape(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape-me')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_responses_carry_server_timing(self):
+        response = self.client.get(reverse('expenseincome-list'))
+        timings = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timings), {'total', 'db', 'serialize'})
+        self.assertRegex(timings['db'], r'dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    def test_view_metrics_are_exposed(self):
+        self.client.get(reverse('expenseincome-list'))
+        self.client.post(reverse('token_obtain_pair'), {'username': 'arun', 'password': 'pass@@@1234567'})
+        body = self.scrape()
+        list_labels = 'view="ExpenseIncomeViewSet.list",method="GET"'
+        self.assertIn(f'expenses_requests_total{{{list_labels},status="200"}} 1', body)
+        self.assertIn(f'expenses_request_duration_seconds_bucket{{{list_labels},le="+Inf"}} 1', body)
+        self.assertIn(f'expenses_db_queries_count{{{list_labels}}} 1', body)
+        self.assertIn(f'expenses_serialize_duration_seconds_count{{{list_labels}}} 1', body)
+        self.assertIn('expenses_requests_total{view="TokenObtainPairView",method="POST",status="200"} 1', body)
+        self.assertIn('expenses_response_cache_total{result="misses"}', body)
+        # The scrape itself is not a DRF view and is not recorded.
+        self.assertNotIn('metrics_view', body)
+
+    def test_scrapes_need_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with override_settings(SLOW_REQUEST_BUDGET_MS=-1), self.assertLogs('expenses_app.metrics', 'WARNING') as logs:
+            self.client.get(reverse('expenseincome-list'))
+        self.assertIn('ExpenseIncomeViewSet.list', logs.output[0])
+        self.assertIn('FROM "expenses_app_expenseincome"', logs.output[0])
+
+
+class QueryBudgetTests(LedgerTestMixin, APITestCase):
+    """
+    Exact query counts per endpoint, with the auth cache warm. An N+1 in
+    get_queryset, the serializers or the permissions changes these counts;
+    the page holds several rows so a per-row query cannot hide.
+    """
+    password = 'arun@@@1234567'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun', password=self.password)
+        other = User.objects.create_user(username='bibek')
+        for i in range(15):
+            ExpenseIncome.objects.create(user=self.user, title=f'Expense {i}', amount=10 + i, transaction_type='debit')
+        self.expense = ExpenseIncome.objects.filter(user=self.user).first()
+        self.theirs = ExpenseIncome.objects.create(user=other, title='Theirs', amount=1, transaction_type='debit')
+        self.log_in(self.user)
+        self.list_url = reverse('expenseincome-list')
+        self.detail_url = reverse('expenseincome-detail', args=[self.expense.pk])
+        self.assertEqual(self.client.get(self.list_url).status_code, status.HTTP_200_OK)
+
+    def assertBudget(self, queries, method, url, data=None, expected_status=status.HTTP_200_OK):
+        caches['responses'].clear()
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, expected_status)
+        return response
+
+    def test_list(self):
+        # COUNT(*) and the page.
+        response = self.assertBudget(2, 'get', self.list_url)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertBudget(1, 'get', f'{self.list_url}?pagination=cursor')
+        search_url = f'{self.list_url}?search=expense&ordering=-amount'
+        self.client.get(search_url)  # The search backend checks for its table once per process.
+        self.assertBudget(2, 'get', search_url)
+
+    def test_retrieve(self):
+        self.assertBudget(1, 'get', self.detail_url)
+        self.assertBudget(
+            1, 'get', reverse('expenseincome-detail', args=[self.theirs.pk]),
+            expected_status=status.HTTP_403_FORBIDDEN,
+        )
+        self.assertBudget(
+            1, 'get', reverse('expenseincome-detail', args=[0]), expected_status=status.HTTP_404_NOT_FOUND,
+        )
+
+    def test_object_is_fetched_once_per_request(self):
+        view = ExpenseIncomeViewSet(
+            request=Request(APIRequestFactory().get(self.detail_url)), kwargs={'pk': self.expense.pk},
+            format_kwarg=None, action='retrieve',
+        )
+        view.request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertIs(view.get_object(), view.get_object())
+
+    def test_cached_reads_skip_the_database(self):
+        self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url)
+
+    def test_create(self):
+        # Savepoint, change sequence, INSERT, balance and rollup updates, release.
+        item = {'title': 'Coffee', 'amount': '3.50', 'transaction_type': 'debit'}
+        self.assertBudget(6, 'post', self.list_url, item, status.HTTP_201_CREATED)
+
+    def test_update(self):
+        # The row, then savepoint, change sequence, UPDATE, balance and rollup
+        # updates, release.
+        item = {'title': 'Rent', 'amount': '800.00', 'transaction_type': 'debit'}
+        self.assertBudget(7, 'put', self.detail_url, item)
+        # Unchanged amounts leave the balance and rollups alone.
+        self.assertBudget(5, 'patch', self.detail_url, {'title': 'Flat rent'})
+
+    def test_delete(self):
+        # The row, then savepoint, DELETE, change sequence, tombstone, balance
+        # and rollup updates, release.
+        self.assertBudget(8, 'delete', self.detail_url, expected_status=status.HTTP_204_NO_CONTENT)
+
+    def test_register(self):
+        self.client.credentials()
+        # The username check and the INSERT.
+        data = {'username': 'chandra', 'password': 'chandra@@@1234567'}
+        self.assertBudget(2, 'post', reverse('register'), data, status.HTTP_201_CREATED)
+
+    def test_login(self):
+        self.client.credentials()
+        data = {'username': 'arun', 'password': self.password}
+        self.assertBudget(1, 'post', reverse('token_obtain_pair'), data)
+
+
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.other = User.objects.create_user(username='bibek')
+        for i in range(12):
+            ExpenseIncome.objects.create(
+                user=self.user, title=f'Groceries {i}', amount=10 + i, tax=1, tax_type='flat', transaction_type='debit',
+            )
+        self.theirs = ExpenseIncome.objects.create(user=self.other, title='Theirs', amount=1, transaction_type='debit')
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.list_url = reverse('async-expenseincome-list')
+
+    def detail_url(self, pk):
+        return reverse('async-expenseincome-detail', args=[pk])
+
+    async def test_list_matches_sync_view(self):
+        for query in ('', '?page=2', '?ordering=amount&page_size=5', '?search=groceries', '?pagination=cursor',
+                      '?pagination=cursor&ordering=total', '?pagination=cursor&ordering=-total&page_size=5'):
+            response = await self.async_client.get(self.list_url + query, headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            expected = await sync_to_async(self.client.get)(reverse('expenseincome-list') + query)
+            self.assertEqual(response.json()['results'], expected.json()['results'])
+        response = await self.async_client.get(self.list_url, headers=self.headers)
+        self.assertEqual(response.json()['count'], 12)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    async def test_invalid_page(self):
+        response = await self.async_client.get(f'{self.list_url}?page=9', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_retrieve(self):
+        expense = await ExpenseIncome.objects.filter(user=self.user).afirst()
+        response = await self.async_client.get(self.detail_url(expense.pk), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(ExpenseIncomeSerializer(expense).data)))
+        response = await self.async_client.get(self.detail_url(self.theirs.pk), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        for pk in (0, 'abc'):
+            response = await self.async_client.get(self.detail_url(pk), headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            expected = await sync_to_async(self.client.get)(reverse('expenseincome-detail', args=[pk]))
+            self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+        response = await self.async_client.get(self.detail_url(0), headers=self.headers)
+        self.assertEqual(response.json(), {'detail': 'No ExpenseIncome matches the given query.'})
+
+    async def test_create_updates_balance(self):
+        data = {'title': 'Salary', 'amount': '500.00', 'transaction_type': 'credit'}
+        response = await self.async_client.post(self.list_url, data, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['total'], 500.0)
+        created = await ExpenseIncome.objects.aget(pk=response.json()['id'])
+        self.assertEqual(created.user_id, self.user.pk)
+        balance = await UserBalance.objects.aget(user=self.user)
+        self.assertEqual(balance.total_credit, Decimal('500'))
+
+        response = await self.async_client.post(self.list_url, {'title': 'x'}, content_type='application/json',
+                                                headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_summary(self):
+        response = await self.async_client.get(reverse('async-expenseincome-summary'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await sync_to_async(self.client.get)(reverse('expenseincome-summary'))
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response.json()['count'], 12)
+
+    async def test_authentication_required(self):
+        response = await self.async_client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(self.list_url, headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_uncached_user_is_loaded(self):
+        await sync_to_async(caches['auth'].clear)()
+        response = await self.async_client.get(reverse('async-expenseincome-summary'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ChangeFeedTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-changes')
+        ExpenseIncome.objects.bulk_create([
+            ExpenseIncome(user=self.user, title=f'Expense {i}', amount=10 + i, transaction_type='debit')
+            for i in range(7)
+        ])
+        ExpenseIncome.objects.create(user=self.other, title='Theirs', amount=1, transaction_type='debit')
+
+    def sync(self, since=None, page_size=None):
+        """Follow the feed to its end; returns the changed ids, deleted ids and the final token."""
+        changed, deleted = [], []
+        while True:
+            params = {key: value for key, value in (('since', since), ('page_size', page_size)) if value}
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            changed += [row['id'] for row in response.data['changes']]
+            deleted += response.data['deleted']
+            since = response.data['next']
+            if not response.data['has_more']:
+                return changed, deleted, since
+
+    def test_full_sync_pages_through_every_record(self):
+        # The bulk insert gives all seven rows one sequence value; ids break the tie.
+        changed, deleted, token = self.sync(page_size=3)
+        own = list(ExpenseIncome.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(changed, own)
+        self.assertEqual(deleted, [])
+        self.assertEqual(self.sync(token), ([], [], token))
+
+    def test_incremental_sync_returns_only_changes(self):
+        _, _, token = self.sync()
+        first, second, third = ExpenseIncome.objects.filter(user=self.user).order_by('pk')[:3]
+        self.client.patch(reverse('expenseincome-detail', args=[second.pk]), {'title': 'Rent'}, format='json')
+        self.client.delete(reverse('expenseincome-detail', args=[first.pk]))
+        created = self.client.post(
+            reverse('expenseincome-list'), {'title': 'Coffee', 'amount': '3.50', 'transaction_type': 'debit'},
+            format='json',
+        ).data['id']
+        third.amount = 99
+        third.save(update_fields=['amount'])
+        ExpenseIncome.objects.create(user=self.other, title='Not mine', amount=1, transaction_type='debit')
+
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual([row['id'] for row in response.data['changes']], [second.pk, created, third.pk])
+        self.assertEqual(response.data['changes'][0]['title'], 'Rent')
+        self.assertEqual(response.data['deleted'], [first.pk])
+        self.assertFalse(response.data['has_more'])
+
+    def test_bulk_and_queryset_writes_are_tracked(self):
+        _, _, token = self.sync()
+        ids = list(ExpenseIncome.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True))
+        response = self.client.patch(
+            reverse('expenseincome-bulk'), [{'id': ids[0], 'title': 'Renamed'}, {'id': ids[1], 'amount': '5'}],
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ExpenseIncome.objects.filter(pk__in=ids[2:4]).delete()
+        changed, deleted, token = self.sync(token, page_size=1)
+        self.assertEqual(changed, ids[:2])
+        self.assertEqual(deleted, ids[2:4])
+
+    def test_moving_a_record_leaves_a_tombstone(self):
+        _, _, token = self.sync()
+        expense = ExpenseIncome.objects.filter(user=self.user).first()
+        expense.user = self.other
+        expense.save()
+        self.assertEqual(self.sync(token)[:2], ([], [expense.pk]))
+
+    def test_query_budget(self):
+        _, _, token = self.sync()
+        # The records and the archived records.
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        # And the tombstones.
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'since': token})
+
+    def test_invalid_token(self):
+        for token in ('nonsense', 'LTEuMA'):  # The second is "-1.0".
+            response = self.client.get(self.url, {'since': token})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('since', response.data)
+
+
+class AdminTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='umesh', password=None)
+        self.user = User.objects.create_user(username='arun')
+        self.client.force_login(self.admin)
+        # The admin uses the session; the API calls below go as `arun`.
+        self.log_in(self.user)
+        self.url = reverse('admin:expenses_app_expenseincome_changelist')
+
+    def changelist_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.create_expenses(self.user, 3)
+        filtered = {'transaction_type__exact': 'debit', 'o': '8'}
+        self.client.get(self.url)
+        few = self.changelist_queries({}), self.changelist_queries(filtered)
+        self.create_expenses(self.user, 30)
+        self.assertEqual((self.changelist_queries({}), self.changelist_queries(filtered)), few)
+        self.assertContains(self.client.get(self.url, filtered), '33 results')
+
+    def test_search(self):
+        self.create_expenses(self.user, 2)
+        ExpenseIncome.objects.create(user=self.admin, title='Groceries', amount=5, transaction_type='debit')
+        response = self.client.get(self.url, {'q': 'grocer'})
+        self.assertEqual(len(response.context['cl'].result_list), 1)
+        response = self.client.get(self.url, {'q': 'arun'})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        # A username doesn't hide the records whose title matches it.
+        ExpenseIncome.objects.create(user=self.admin, title='Arun birthday', amount=5, transaction_type='debit')
+        response = self.client.get(self.url, {'q': 'arun'})
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+
+    def test_paginator_estimates_unfiltered_counts(self):
+        self.create_expenses(self.user, 5)
+        paginator = EstimatedCountPaginator(ExpenseIncome.objects.order_by('pk'), 2)
+        paginator.count_limit = 3
+        self.assertEqual(paginator.count, 3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(ExpenseIncome.objects.order_by('pk'), 2)
+        paginator.count_limit = 3
+        self.assertEqual(paginator.count, 5)
+        paginator = EstimatedCountPaginator(ExpenseIncome.objects.filter(amount=10).order_by('pk'), 2)
+        paginator.count_limit = 3
+        self.assertEqual((paginator.count, str(paginator.count)), (3, '3+'))
+        paginator = EstimatedCountPaginator(ExpenseIncome.objects.filter(amount=10).order_by('pk'), 2)
+        paginator.count_limit = 5
+        self.assertEqual((paginator.count, str(paginator.count)), (5, '5'))
+
+    @mock.patch.object(EstimatedCountPaginator, 'count_limit', 3)
+    def test_capped_counts_are_shown_as_such(self):
+        self.create_expenses(self.user, 5)
+        response = self.client.get(self.url, {'transaction_type__exact': 'debit'})
+        self.assertContains(response, '3+ results')
+        self.assertContains(response, '3+ expense incomes')
+
+    def test_bulk_edit_actions(self):
+        rows = self.create_expenses(self.user, 5, tax=10, tax_type='flat')
+        since = self.client.get(reverse('expenseincome-changes')).data['next']
+        selected = [row.pk for row in rows[:3]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'action': 'mark_credit', '_selected_action': selected})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "expenses_app_expenseincome"')]
+        self.assertEqual(len(updates), 1)
+        balance = UserBalance.objects.get(user=self.user)
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.count), (60, 40, 5))
+        self.assertEqual(ExpenseRollup.objects.get(user=self.user, transaction_type='credit').total, 60)
+
+        self.client.post(self.url, {'action': 'set_percentage_tax', '_selected_action': selected})
+        balance.refresh_from_db()
+        # 10% of 10 on the three credits, a flat 10 on the two debits.
+        self.assertEqual((balance.total_credit, balance.total_debit, balance.tax_paid), (33, 40, 23))
+        response = self.client.get(reverse('expenseincome-changes'), {'since': since})
+        self.assertEqual(sorted(row['id'] for row in response.data['changes']), selected)
+
+    def test_edit_runs_in_batches(self):
+        self.create_expenses(self.user, 5)
+        edited = ExpenseIncome.objects.filter(transaction_type='debit').edit(batch_size=2, transaction_type='credit')
+        self.assertEqual(edited, 5)
+        self.assertEqual(UserBalance.objects.get(user=self.user).total_credit, 50)
+        # One sequence value per batch.
+        self.assertEqual(ExpenseIncome.objects.values('change_seq').distinct().count(), 3)
+        with self.assertRaises(TypeError):
+            ExpenseIncome.objects.edit(user=self.admin)
+
+
+class ArchiveTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.log_in(self.user)
+        self.url = reverse('expenseincome-list')
+        self.now = timezone.now()
+        self.old = [self.create(500 + i, title=f'Old {i}', amount=10 * (i + 1)) for i in range(3)]
+        self.recent = [self.create(10 + i, title=f'Recent {i}', amount=5) for i in range(2)]
+
+    def create(self, days_ago, **kwargs):
+        expense = ExpenseIncome.objects.create(user=self.user, transaction_type='debit', **kwargs)
+        expense.created_at = self.now - timedelta(days=days_ago)
+        expense.save()
+        return expense
+
+    def archive(self):
+        call_command('archive_expenses', batch_size=2, stdout=StringIO())
+
+    def list_ids(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['id'] for row in response.data['results']]
+
+    def test_archiving_keeps_aggregates(self):
+        summary = self.client.get(reverse('expenseincome-summary')).data
+        self.archive()
+        self.assertEqual(ExpenseIncome.objects.count(), 2)
+        self.assertEqual(ArchivedExpense.objects.count(), 3)
+        caches['responses'].clear()
+        self.assertEqual(self.client.get(reverse('expenseincome-summary')).data, summary)
+        self.assertEqual(UserBalance.objects.reconcile(), [])
+        ExpenseRollup.objects.rebuild()
+        self.assertEqual(ExpenseRollup.objects.filter(user=self.user).aggregate(Sum('count'))['count__sum'], 5)
+        self.archive()
+        self.assertEqual(ArchivedExpense.objects.count(), 3)
+
+    def test_list_reads_the_archive_for_old_dates(self):
+        self.archive()
+        newest_first = [expense.pk for expense in self.recent + self.old]
+        self.assertEqual(self.list_ids({}), newest_first[:2])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.list_ids({'created_at__gte': self.now - timedelta(days=30)}), newest_first[:2])
+        self.assertNotIn('archivedexpense', ' '.join(query['sql'] for query in queries))
+        self.assertEqual(self.list_ids({'created_at__lte': self.now}), newest_first)
+        self.assertEqual(self.list_ids({'created_at__gte': self.now - timedelta(days=500, hours=12)}), newest_first[:3])
+        self.assertEqual(
+            self.list_ids({'created_at__lte': self.now, 'ordering': '-total'}),
+            [self.old[2].pk, self.old[1].pk, self.old[0].pk, self.recent[0].pk, self.recent[1].pk],
+        )
+        self.assertEqual(self.list_ids({'created_at__lte': self.now, 'search': 'old'}), newest_first[2:])
+        response = self.client.get(self.url, {'created_at__lte': self.now, 'page_size': 2})
+        self.assertEqual(response.data['count'], 5)
+
+    def test_export_includes_archived_records(self):
+        self.archive()
+        response = self.client.get(reverse('expenseincome-export'), {'created_at__lte': self.now.isoformat()})
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['title'] for row in rows], ['Recent 0', 'Recent 1', 'Old 0', 'Old 1', 'Old 2'])
+        self.assertEqual(rows[-1]['total'], '30.0')
+
+    def test_analytics_count_archived_records(self):
+        self.archive()
+        # Not archived yet, so its day is split between the two tables.
+        self.create(500, title='Old 3', amount=40)
+        url = reverse('expenseincome-analytics')
+        from_rollups = self.client.get(url, {'period': 'day'}).data
+        self.assertEqual(sum(bucket['count'] for bucket in from_rollups), 6)
+        # A total filter matching every record sends analytics to the ledger.
+        self.assertEqual(self.client.get(url, {'period': 'day', 'total__gte': 0}).data, from_rollups)
+        response = self.client.get(url, {'period': 'day', 'search': 'old'})
+        self.assertEqual(sum(bucket['count'] for bucket in response.data), 4)
+        self.assertEqual(sum(Decimal(bucket['total']) for bucket in response.data), 100)
+
+    def test_change_feed_includes_archived_records(self):
+        url = reverse('expenseincome-changes')
+        token = self.client.get(url).data['next']
+        self.archive()
+        response = self.client.get(url)
+        self.assertEqual(sorted(row['id'] for row in response.data['changes']),
+                         sorted(expense.pk for expense in self.old + self.recent))
+        self.assertEqual(self.client.get(url, {'since': token}).data['changes'], [])
+
+    def test_horizon_is_the_minimum(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_expenses', days=30, stdout=StringIO())
+
+
+class PurgeTests(LedgerTestMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='arun')
+        self.other = User.objects.create_user(username='bibek')
+        self.log_in(self.user)
+        self.url = reverse('userpurge-list')
+
+    def test_request_deactivates_at_once(self):
+        self.create_expenses(self.user, 3)
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['user_id'], response.data['status']), (self.user.pk, 'pending'))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(ExpenseIncome.objects.filter(user=self.user).count(), 3)
+        response = self.client.get(reverse('expenseincome-list'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_superusers_purge_others(self):
+        # Someone else's account and a missing one look the same.
+        missing = User.objects.order_by('-pk').first().pk + 100
+        responses = [self.client.post(self.url, {'user': pk}, format='json') for pk in (self.other.pk, missing)]
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_400_BAD_REQUEST] * 2)
+        self.assertEqual([response.data['user'][0].code for response in responses], ['does_not_exist'] * 2)
+        self.assertTrue(User.objects.get(pk=self.other.pk).is_active)
+        admin = User.objects.create_superuser(username='umesh', password=None)
+        self.log_in(admin)
+        response = self.client.post(self.url, {'user': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.client.get(reverse('userpurge-detail', args=[response.data['id']])).data['username'],
+                         'bibek')
+
+    def test_worker_deletes_in_batches(self):
+        self.create_expenses(self.user, 25)
+        self.create_expenses(self.other, 2)
+        expense = ExpenseIncome.objects.filter(user=self.user).first()
+        expense.delete()
+        expense = ExpenseIncome.objects.filter(user=self.user).first()
+        expense.created_at = timezone.now() - timedelta(days=800)
+        expense.save()
+        call_command('archive_expenses', stdout=StringIO())
+        purge = UserPurge.objects.request(self.user)
+        call_command('process_purges', once=True, batch_size=10, stdout=StringIO())
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, UserPurge.DONE)
+        # 23 live and 1 archived expense, 1 tombstone and the rollup rows.
+        rollups = 2
+        self.assertEqual(purge.rows_deleted, 23 + 1 + 1 + rollups)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(ExpenseIncome.objects.count(), 2)
+        self.assertEqual(UserBalance.objects.get(user=self.other).count, 2)
+
+    def test_uploads_are_deleted_with_the_account(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            job = ImportJob.objects.create(user=self.user, file=SimpleUploadedFile('statement.csv', b'title\n'))
+            path = job.file.path
+            self.assertTrue(os.path.exists(path))
+            UserPurge.objects.request(self.user)
+            self.assertEqual(run_purge(UserPurge.objects.claim()).status, UserPurge.DONE)
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_interrupted_purge_resumes(self):
+        self.create_expenses(self.user, 5)
+        UserPurge.objects.request(self.user)
+        purge = UserPurge.objects.claim()
+        self.assertIsNone(UserPurge.objects.claim())
+        # The worker deleted some rows, then died.
+        ExpenseIncome.objects.filter(pk__in=ExpenseIncome.objects.filter(user=self.user).values('pk')[:2])._raw_delete('default')
+        UserPurge.objects.filter(pk=purge.pk).update(rows_deleted=2, updated_at=timezone.now() - timedelta(hours=1))
+        resumed = UserPurge.objects.claim()
+        self.assertEqual((resumed.pk, resumed.rows_deleted, resumed.started_at), (purge.pk, 2, purge.started_at))
+        run_purge(resumed)
+        self.assertEqual((resumed.status, resumed.rows_deleted), (UserPurge.DONE, 2 + 3 + 1))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+
+    def test_admin_delete_queues_a_purge(self):
+        self.create_expenses(self.user, 3)
+        admin = User.objects.create_superuser(username='umesh', password=None)
+        self.client.force_login(admin)
+        url = reverse('admin:auth_user_delete', args=[self.user.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(url, {'post': 'yes'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(UserPurge.objects.get().user_id, self.user.pk)
+        self.assertEqual(ExpenseIncome.objects.filter(user=self.user).count(), 3)
+
+
+class PurgeMemoryTests(LedgerTestMixin, APITransactionTestCase):
+    # Each batch must really commit: in a TestCase transaction the batches'
+    # on_commit callbacks would pile up until the test ends.
+
+    def test_memory_does_not_grow_with_the_account(self):
+        # A 1M-row account is too slow to seed here (see `benchmark purge`).
+        # Holding the 18,000 extra ids alone would take over 600 KB; the
+        # first, untimed purge warms up query compilation and caches.
+        peaks = []
+        for count in (10, 2000, 20000):
+            user = User.objects.create_user(username=f'heavy{count}')
+            self.create_expenses(user, count)
+            UserPurge.objects.request(user)
+            purge = UserPurge.objects.claim()
+            tracemalloc.start()
+            run_purge(purge, batch_size=500)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            self.assertEqual(purge.status, UserPurge.DONE)
+        self.assertLess(peaks[2] - peaks[1], 200_000)
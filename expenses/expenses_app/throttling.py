@@ -0,0 +1,72 @@
+"""
+Counter-based throttles.
+
+DRF's SimpleRateThrottle stores every request timestamp of the window in one
+cache entry, so each request reads, trims, pickles and writes a list of up to
+`num_requests` items, and two processes can overwrite each other's list. These
+throttles keep a sliding-window estimate from two fixed-window counters
+instead: the current window's count, updated with cache.incr, plus the previous
+window's count weighted by how much of it the sliding window still covers.
+The cost per request is the same at 10/hour and 100000/hour, and increments
+are atomic on shared backends (Redis, Memcached) and in local memory.
+"""
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+
+class CounterRateThrottleMixin:
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        self.elapsed = self.now - window * self.duration
+        current_key, previous_key = f'{self.key}:{window}', f'{self.key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        self.previous = counts.get(previous_key, 0)
+        self.current = counts.get(current_key, 0)
+        # A throttled client costs one read and no write.
+        if self.estimate(self.current + 1) > self.num_requests:
+            return self.throttle_failure()
+        self.current = self.increment(current_key)
+        if self.estimate(self.current) > self.num_requests:
+            # Another process took the last slot between the read and the increment.
+            self.cache.decr(current_key)
+            self.current -= 1
+            return self.throttle_failure()
+        return self.throttle_success()
+
+    def increment(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # The previous window must stay readable for a whole window.
+            self.cache.add(key, 0, self.duration * 2)
+            return self.cache.incr(key)
+
+    def estimate(self, current):
+        overlap = (self.duration - self.elapsed) / self.duration
+        return self.previous * overlap + current
+
+    def throttle_success(self):
+        return True
+
+    def wait(self):
+        remaining = self.duration - self.elapsed
+        if self.current >= self.num_requests or not self.previous:
+            return remaining
+        # Seconds until the previous window's weight has decayed enough to
+        # leave room for one more request.
+        headroom = self.num_requests - self.current - 1
+        return max(remaining - headroom * self.duration / self.previous, 0)
+
+
+class AnonCounterRateThrottle(CounterRateThrottleMixin, AnonRateThrottle):
+    pass
+
+
+class UserCounterRateThrottle(CounterRateThrottleMixin, UserRateThrottle):
+    pass
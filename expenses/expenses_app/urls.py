@@ -1,15 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserRegisterView, ExpenseIncomeViewSet
+from .views import UserRegisterView, ExpenseIncomeViewSet, ImportJobViewSet, UserPurgeViewSet
+from .async_views import AsyncExpenseIncomeViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 router = DefaultRouter()
 router.register(r'expenses', ExpenseIncomeViewSet, basename='expenseincome')
+router.register(r'imports', ImportJobViewSet, basename='importjob')
+router.register(r'purges', UserPurgeViewSet, basename='userpurge')
 
 urlpatterns = [
     path('auth/register/', UserRegisterView.as_view(), name='register'),
     path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    # Async list/retrieve/create/summary for ASGI deployments (see async_views).
+    path('async/expenses/', AsyncExpenseIncomeViewSet.as_view({'get': 'list', 'post': 'create'}),
+         name='async-expenseincome-list'),
+    path('async/expenses/summary/', AsyncExpenseIncomeViewSet.as_view({'get': 'summary'}),
+         name='async-expenseincome-summary'),
+    path('async/expenses/<pk>/', AsyncExpenseIncomeViewSet.as_view({'get': 'retrieve'}),
+         name='async-expenseincome-detail'),
     path('', include(router.urls)),
 ] 
  
\ No newline at end of file
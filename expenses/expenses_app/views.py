@@ -1,53 +1,351 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, generics, filters
+from rest_framework import viewsets, permissions, generics, filters, mixins
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Sum
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import ExpenseIncome
-from .serializers import UserRegisterSerializer, ExpenseIncomeSerializer
+from .models import ExpenseIncome, ExpenseRollup, ImportJob, UserBalance, UserPurge, total_expression
+from .serializers import (
+    AnalyticsBucketSerializer, AnalyticsQuerySerializer, ChangesQuerySerializer, ExpenseIncomeListSerializer,
+    ExpenseIncomeRowSerializer, ExpenseIncomeSerializer, ImportJobSerializer, UserBalanceSerializer,
+    UserPurgeSerializer, UserRegisterSerializer, is_record_id,
+)
+from .pagination import ExpenseIncomePagination
+from .filters import ExpenseIncomeFilter
+from .parsers import NDJSONParser
+from .renderers import CSVRenderer, ExportContentNegotiation, FastJSONRenderer, NDJSONRenderer
+from .exports import EXPORT_FIELDS, stream_csv, stream_ndjson
+from .db_routers import read_from_replica
+from .archive import archived_queryset, buckets_with_archived, with_archived
+from .caching import CachedResponseMixin, response_cache_stats
+from .search import ExpenseSearchFilter
+from .sync import START, change_page, encode_token
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import ValidationError
 
 # Create your views here.
 
 class IsOwnerOrSuperuser(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user.is_superuser or obj.user == request.user
+        return request.user.is_superuser or obj.user_id == request.user.id
 
 class UserRegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegisterSerializer
     throttle_scope = 'anon'  # Anonymous users have lower rate limits
 
-class ExpenseIncomeViewSet(viewsets.ModelViewSet):
+class ExpenseIncomeViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = ExpenseIncomeSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrSuperuser]
+    pagination_class = ExpenseIncomePagination
     
     # Filtering, Searching, and Ordering
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['transaction_type', 'tax_type', 'created_at', 'updated_at']
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ExpenseSearchFilter]
+    filterset_class = ExpenseIncomeFilter
     search_fields = ['title', 'description']
-    ordering_fields = ['created_at', 'updated_at', 'amount', 'title']
+    ordering_fields = ['created_at', 'updated_at', 'amount', 'title', 'total']
     ordering = ['-created_at']
     
+    # Filters the daily rollup table can answer; anything else is computed
+    # from the ledger itself.
+    rollup_filter_fields = {'transaction_type', 'tax_type'}
+
+    # Largest batch accepted by the bulk endpoint.
+    bulk_max_items = 50000
+
+    # Actions whose ?search= results come best match first (unless ?ordering= is given).
+    ranked_search_actions = {'list', 'export'}
+
+    # Read-only actions that may be served by a replica.
+    replica_actions = {'list', 'retrieve', 'summary'}
+
     # Throttling
     throttle_scope = 'user'
 
+    # Set by get_object() once the permission check has passed.
+    checked_object = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions:
+            read_from_replica()
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        if self.action == 'export':
+            # The export renderers only pick a format; errors are JSON.
+            self.request.accepted_renderer = FastJSONRenderer()
+            self.request.accepted_media_type = FastJSONRenderer.media_type
+        return response
+
     def get_queryset(self):
         user = self.request.user
+        queryset = ExpenseIncome.objects.with_total()
         if user.is_superuser:
-            return ExpenseIncome.objects.all().order_by('-created_at')
-        return ExpenseIncome.objects.filter(user=user).order_by('-created_at')
+            return queryset.order_by('-created_at')
+        return queryset.filter(user=user).order_by('-created_at')
+
+    def get_serializer_class(self):
+        # `list` pages are fetched as .values() rows (see paginate_queryset).
+        if self.action == 'list':
+            return ExpenseIncomeRowSerializer
+        return super().get_serializer_class()
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list':
+            queryset = self.list_rows(queryset)
+        return super().paginate_queryset(queryset)
+
+    def list_rows(self, queryset):
+        """`list`'s .values() rows, with archived ones when a date filter reaches them."""
+        fields = ExpenseIncomeRowSerializer.row_fields
+        if self.paginator.use_cursor(self.request):
+            # Cursor pages filter on the ordering column, which a UNION
+            # can't take, so they stay on the hot table. The next cursor is
+            # read from the last row, so it has to carry that column.
+            ordering = filters.OrderingFilter().get_ordering(self.request, queryset, self)
+            if any(term.lstrip('-') == 'total' for term in ordering):
+                return queryset.annotate(total=total_expression()).values(*fields, 'total')
+            return queryset.values(*fields)
+        return with_archived(self, queryset, fields)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     def get_object(self):
-        # Always fetch from all objects so we can check permissions
-        queryset = ExpenseIncome.objects.all()
-        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
-        lookup_value = self.kwargs[lookup_url_kwarg]
-        obj = queryset.get(**{self.lookup_field: lookup_value})
-        self.check_object_permissions(self.request, obj)
-        return obj
+        # One primary key lookup, not scoped to the user: someone else's record
+        # must be a 403, not a 404. IsOwnerOrSuperuser compares user_id, so the
+        # owner is never loaded. The view lives for one request, so the checked
+        # object is kept for any later call.
+        if self.checked_object is None:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            obj = generics.get_object_or_404(
+                ExpenseIncome.objects.all(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+            )
+            self.check_object_permissions(self.request, obj)
+            self.checked_object = obj
+        return self.checked_object
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        # Read from the materialized UserBalance rows instead of scanning the
+        # ledger; filters and pagination do not apply here.
+        if request.user.is_superuser:
+            totals = UserBalance.objects.aggregate(
+                **{name: Sum(name, default=0) for name in UserBalance.objects.delta_fields}
+            )
+            balance = UserBalance(**totals)
+        else:
+            balance = UserBalance.objects.for_user(request.user)
+        return Response(UserBalanceSerializer(balance).data)
+
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        params = AnalyticsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        period = params.validated_data['period']
+        start = params.validated_data.get('start')
+        end = params.validated_data.get('end')
+
+        if self.can_use_rollups(request):
+            queryset = ExpenseRollup.objects.all()
+            if not request.user.is_superuser:
+                queryset = queryset.filter(user=request.user)
+            # The rollup has the same transaction_type/tax_type columns, so the
+            # regular filterset validates and applies those parameters.
+            filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+            if not filterset.is_valid():
+                raise ValidationError(filterset.errors)
+            queryset = filterset.qs
+            if start:
+                queryset = queryset.filter(day__gte=start)
+            if end:
+                queryset = queryset.filter(day__lte=end)
+            buckets = queryset.buckets(period)
+        else:
+            # The rollups count archived rows, so the ledger path reads them too.
+            querysets = [self.filter_queryset(self.get_queryset()), archived_queryset(self, whole_history=True)]
+            if start:
+                querysets = [queryset.filter(created_at__date__gte=start) for queryset in querysets]
+            if end:
+                querysets = [queryset.filter(created_at__date__lte=end) for queryset in querysets]
+            buckets = buckets_with_archived(querysets, period)
+        return Response(AnalyticsBucketSerializer(buckets, many=True).data)
+
+    def can_use_rollups(self, request):
+        search_param = filters.SearchFilter.search_param
+        used = {name for name in self.filterset_class.base_filters if request.query_params.get(name)}
+        return not request.query_params.get(search_param) and used <= self.rollup_filter_fields
+
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Records created, updated or deleted since `?since=` (the `next` token
+        of the previous response; leave it out for a full sync), oldest change
+        first. Keep following `next` while `has_more` is true. Always the
+        caller's own records, for superusers too.
+        """
+        params = ChangesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rows, deleted, position, has_more = change_page(
+            request.user, params.validated_data.get('since', START), params.validated_data['page_size'],
+            ExpenseIncomeRowSerializer.row_fields,
+        )
+        serializer = ExpenseIncomeRowSerializer(rows, many=True, context=self.get_serializer_context())
+        return Response({
+            'changes': serializer.data,
+            'deleted': deleted,
+            'next': encode_token(position),
+            'has_more': has_more,
+        })
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Response cache hits, misses and 304s served by this process."""
+        return Response(response_cache_stats.snapshot())
+
+    @action(
+        detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer],
+        content_negotiation_class=ExportContentNegotiation,
+    )
+    def export(self, request):
+        """
+        Stream every matching record as CSV (default) or NDJSON
+        (`?format=ndjson`); other formats are a 406. Filters, search and
+        ordering apply; pagination does not. Archived records are included
+        as in `list`.
+        """
+        rows = with_archived(self, self.filter_queryset(self.get_queryset()), EXPORT_FIELDS)
+        if request.accepted_renderer.format == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+            filename = 'expenses.ndjson'
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+            filename = 'expenses.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post', 'patch', 'delete'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create (POST), partially update (PATCH, items need an `id`) or delete
+        (DELETE, a list of ids) many records in one request. Valid items are
+        written even if others fail; `results` lines up with the input.
+        """
+        if request.method == 'DELETE':
+            return self.bulk_destroy(request)
+        instances = None
+        if request.method == 'PATCH':
+            ids = [
+                item['id'] for item in request.data
+                if isinstance(item, dict) and is_record_id(item.get('id'))
+            ] if isinstance(request.data, list) else []
+            instances = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            instances, data=request.data, many=True, partial=instances is not None,
+            max_length=self.bulk_max_items, allow_empty=False,
+        )
+        serializer.is_valid(raise_exception=True)
+        if instances is None:
+            serializer.save(user=request.user)
+        else:
+            serializer.save()
+        results = [{'errors': errors} for errors in serializer.item_errors]
+        for index, obj in zip(serializer.valid_indices, serializer.instance):
+            results[index] = {'id': obj.pk}
+        success = status.HTTP_201_CREATED if instances is None else status.HTTP_200_OK
+        return self.bulk_response(results, len(serializer.valid_indices), success)
+
+    def bulk_destroy(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of ids.']})
+        if not items:
+            raise ValidationError({'non_field_errors': ['This list may not be empty.']})
+        if len(items) > self.bulk_max_items:
+            raise ValidationError({
+                'non_field_errors': [f'Ensure this field has no more than {self.bulk_max_items} elements.'],
+            })
+        ids = [item.get('id') if isinstance(item, dict) else item for item in items]
+        found = set(self.get_queryset().filter(pk__in=[pk for pk in ids if is_record_id(pk)])
+                    .values_list('pk', flat=True))
+        found_ids = sorted(found)
+        chunk_size = ExpenseIncomeListSerializer.chunk_size
+        for start in range(0, len(found_ids), chunk_size):
+            with transaction.atomic():
+                ExpenseIncome.objects.filter(pk__in=found_ids[start:start + chunk_size]).delete()
+        results = []
+        for pk in ids:
+            if is_record_id(pk) and pk in found:
+                results.append({'id': pk})
+                found.discard(pk)
+            else:
+                results.append({'errors': {'id': ['Not found.']}})
+        return self.bulk_response(results, sum('id' in result for result in results), status.HTTP_200_OK)
+
+    def bulk_response(self, results, succeeded, success_status):
+        failed = len(results) - succeeded
+        if not failed:
+            response_status = success_status
+        elif succeeded:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'succeeded': succeeded, 'failed': failed, 'results': results}, status=response_status)
+
+
+class ImportJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Upload a CSV statement (multipart field `file`) and poll its progress.
+    The upload is only stored here; `manage.py process_imports` does the
+    import in the background.
+    """
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrSuperuser]
+    parser_classes = [MultiPartParser]
+    throttle_scope = 'user'
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_superuser:
+            return ImportJob.objects.order_by('-created_at')
+        return ImportJob.objects.filter(user=user).order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+
+class UserPurgeViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Delete an account and all of its records. The account is deactivated
+    at once; `manage.py process_purges` deletes the records in the
+    background. Users can purge their own account, superusers any account
+    (`user`), and only superusers can poll purges afterwards.
+    """
+    serializer_class = UserPurgeSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_scope = 'user'
+
+    def get_queryset(self):
+        if self.request.user.is_superuser:
+            return UserPurge.objects.order_by('-requested_at')
+        return UserPurge.objects.none()
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data.get('user', request.user)
+        purge = UserPurge.objects.request(user)
+        return Response(self.get_serializer(purge).data, status=status.HTTP_202_ACCEPTED)